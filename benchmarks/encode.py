@@ -0,0 +1,93 @@
+"""
+    Encode-time benchmark for maintenance batches.
+
+    Builds the change records of a generated item import and times RequestEncoder.mnt_request over them, in
+    batches of --batch-size records, with every installed JSON codec. The same records are also encoded as
+    plain dictionaries, the t-mnt-tt representation before Change records, as the reference. Reports the
+    best of --repeat runs and the payload size. No SX.e server is needed.
+
+    Examples:
+        python benchmarks/encode.py --rows 40000
+        python benchmarks/encode.py --rows 40000 --batch-size 500 --json encode.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py_sxapi.changes import item_changes, item_keys  # noqa: E402
+from py_sxapi.codec import RequestEncoder, get_codec  # noqa: E402
+
+from run import CREDENTIALS, item_rows  # noqa: E402
+
+COLUMNS = ['codec', 'records', 'seconds', 'records_per_sec', 'payload_mb', 'vs_dict']
+
+
+def installed_codecs():
+    codecs = []
+    for name in ['json', 'ujson', 'orjson']:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+def encode_time(encoder, batches, repeat):
+    """
+    Output: A tuple of the best seconds of repeat runs encoding every batch, and the total payload bytes
+    """
+    best, size = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = sum(len(encoder.mnt_request(CREDENTIALS, batch)) for batch in batches)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=40000, help='generated item rows, 6 records each')
+    parser.add_argument('--batch-size', type=int, default=100, help='records per maintenance request')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per codec, the best one is reported')
+    parser.add_argument('--json', default='', help='write the results to this file')
+    args = parser.parse_args()
+
+    rows = list(item_rows(args.rows))
+    changes = item_changes(rows, {item_keys(row): 'chg' for row in rows})
+    dicts = [change.as_dict() for change in changes]
+
+    results = []
+    for codec in installed_codecs():
+        encoder = RequestEncoder(codec)
+        sample = args.batch_size
+        if encoder.mnt_request(CREDENTIALS, changes[:sample]) != encoder.mnt_request(CREDENTIALS, dicts[:sample]):
+            raise AssertionError('%s encodes Change records differently from dictionaries' % codec.name)
+        timings = {}
+        for kind, records in [('dict', dicts), ('Change', changes)]:
+            batches = [records[i:i + args.batch_size] for i in range(0, len(records), args.batch_size)]
+            timings[kind] = encode_time(encoder, batches, args.repeat)
+        for kind, (seconds, size) in timings.items():
+            results.append({'codec': '%s %s' % (codec.name, kind),
+                            'records': len(changes),
+                            'seconds': round(seconds, 4),
+                            'records_per_sec': round(len(changes) / seconds),
+                            'payload_mb': round(size / 1048576.0, 2),
+                            'vs_dict': round(seconds / timings['dict'][0], 2)})
+
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in COLUMNS]
+    print('  '.join(c.rjust(w) for c, w in zip(COLUMNS, widths)))
+    for result in results:
+        print('  '.join(str(result[c]).rjust(w) for c, w in zip(COLUMNS, widths)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
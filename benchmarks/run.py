@@ -0,0 +1,226 @@
+"""
+    Benchmark harness for py_sxapi.
+
+    Starts the stub SXAPI server (stub_server.py) in its own process, runs item_import, customer_import,
+    pricing_import, get_pricing and get_pricing_matrix against it over generated datasets of each requested
+    size, and reports rows/sec, requests/sec, peak Python memory and exact call latency percentiles (of the
+    calls made in this process: with --shards, the workers' calls are not included). No SX.e server is needed.
+    --trace prints where the time of each run went, phase by phase (see py_sxapi/tracing.py).
+
+    Client settings (batch sizes, pool size, caches...) come from config.ini in the working directory,
+    as they would for any other py_sxapi client.
+
+    Examples:
+        python benchmarks/run.py --sizes 100,1000 --latency 0.005
+        python benchmarks/run.py --sizes 5000 --workers 8 --inflight 4 --json after.json --compare before.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py_sxapi.py_sxapi import py_sxapi  # noqa: E402
+from py_sxapi.tracing import RecordingTracer  # noqa: E402
+
+from stub_server import serve  # noqa: E402
+
+CREDENTIALS = {'cono': 1, 'username': 'bnch', 'password': 'bench'}
+
+
+def item_rows(n):
+    for i in range(n):
+        row = {'prod': 'BENCH%07d' % i}
+        if i % 2:
+            row['whse'] = '100P'
+        row.update({'descrip': 'Benchmark item %d' % i, 'stndcost': '%.2f' % (i % 997 / 3.0),
+                    'listprice': '%.2f' % (i % 991 / 2.0), 'unitstock': 'each', 'prodcat': 'B%02d' % (i % 40)})
+        yield row
+
+
+def customer_rows(n):
+    for i in range(n):
+        yield {'custno': 100000 + i, 'shipto': '', 'name': 'Benchmark customer %d' % i,
+               'addr1': '%d Main St' % i, 'city': 'Springfield', 'state': 'IL', 'zipcd': '%05d' % (i % 99999)}
+
+
+def pricing_rows(n):
+    for i in range(n):
+        yield {'pdrecno': str(i) if i % 3 else '', 'prod': 'BENCH%07d' % (i % 5000), 'levelcd': 1,
+               'custno': 100000 + i % 300, 'prctype': 'B', 'qtybrk1': 10, 'prcmult1': '0.95'}
+
+
+def price_rows(n):
+    # a few hundred hot SKUs, like the quoting front end
+    for i in range(n):
+        yield {'prod': 'BENCH%07d' % (i % 250), 'qty': 1 + i % 3}
+
+
+def matrix_grid(n):
+    # 10 customers x 3 quantity breaks x n / 30 products, about n cells
+    customers = [100000 + i for i in range(10)]
+    products = ['BENCH%07d' % i for i in range(max(1, n // 30))]
+    return customers, products, [1, 10, 100]
+
+
+def scenarios(args):
+    return [
+        ('item_import', item_rows,
+         lambda client, rows: client.item_import(rows, CREDENTIALS, workers=args.workers, inflight=args.inflight,
+                                                 shards=args.shards)),
+        ('customer_import', customer_rows,
+         lambda client, rows: client.customer_import(rows, CREDENTIALS, inflight=args.inflight, shards=args.shards)),
+        ('pricing_import', pricing_rows,
+         lambda client, rows: client.pricing_import(rows, CREDENTIALS, inflight=args.inflight, shards=args.shards)),
+        ('get_pricing', price_rows,
+         lambda client, rows: client.get_pricing(rows, '100001', '', '100P', CREDENTIALS)),
+        ('pricing_matrix', matrix_grid,
+         lambda client, grid: client.get_pricing_matrix(*grid, warehouse='100P', credentials=CREDENTIALS,
+                                                        workers=args.workers)),
+    ]
+
+
+def record_latencies(client):
+    """
+    Keeps the latency of every call the client makes, in seconds, so the percentiles are exact: the buckets of
+    the metrics histogram are far too coarse for stub calls of a few milliseconds. Calls made by shard worker
+    processes are not seen.
+    Output: The list the latencies are appended to
+    """
+    latencies = []
+    metrics = client.metrics
+    observe, observe_exception = metrics.observe, metrics.observe_exception
+
+    def timed_observe(function, seconds, *args):
+        latencies.append(seconds)
+        observe(function, seconds, *args)
+
+    def timed_observe_exception(function, seconds):
+        latencies.append(seconds)
+        observe_exception(function, seconds)
+
+    metrics.observe, metrics.observe_exception = timed_observe, timed_observe_exception
+    return latencies
+
+
+def percentile_ms(latencies, q):
+    """
+    Output: The nearest-rank q percentile of the sorted latencies, in milliseconds, or '' if there are none
+    """
+    if not latencies:
+        return ''
+    return round(latencies[max(0, int(math.ceil(q / 100.0 * len(latencies))) - 1)] * 1000, 2)
+
+
+def run_one(endpoint, name, make_rows, call, size, trace_memory=True, trace=False):
+    rows = make_rows(size)
+    if not isinstance(rows, tuple):
+        rows = list(rows)
+    tracer = RecordingTracer() if trace else None
+    client = py_sxapi('test', endpoint, tracer=tracer)
+    latencies = record_latencies(client)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    call(client, rows)
+    seconds = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    snapshot = client.metrics.snapshot()
+    latencies.sort()
+    requests = sum(function['calls'] for function in snapshot.values())
+    client.close()
+    if tracer is not None:
+        print('%s, %d rows\n%s\n' % (name, size, tracer.report()))
+
+    return {'scenario': name,
+            'rows': size,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(size / seconds, 1),
+            'requests': requests,
+            'requests_per_sec': round(requests / seconds, 1),
+            'peak_mb': round(peak / 1048576.0, 2),
+            'p50_ms': percentile_ms(latencies, 50),
+            'p90_ms': percentile_ms(latencies, 90),
+            'p99_ms': percentile_ms(latencies, 99)}
+
+
+def print_table(results, baseline=None):
+    columns = ['scenario', 'rows', 'seconds', 'rows_per_sec', 'requests', 'requests_per_sec', 'peak_mb',
+               'p50_ms', 'p90_ms', 'p99_ms']
+    if baseline:
+        columns.append('speedup')
+        before = {(r['scenario'], r['rows']): r for r in baseline}
+        for result in results:
+            old = before.get((result['scenario'], result['rows']))
+            result['speedup'] = round(old['seconds'] / result['seconds'], 2) if old else ''
+
+    widths = [max(len(c), *(len(str(r.get(c, ''))) for r in results)) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result.get(c, '')).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000', help='comma separated dataset sizes, in rows')
+    parser.add_argument('--scenarios', default='', help='comma separated subset of scenarios to run')
+    parser.add_argument('--latency', type=float, default=0.002, help='stub seconds added to every call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='stub random extra seconds per call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='stub share of cErrorMessage replies')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='stub share of HTTP 500 replies')
+    parser.add_argument('--workers', type=int, default=None, help='item_import existence check workers')
+    parser.add_argument('--inflight', type=int, default=None, help='maintenance batches in flight')
+    parser.add_argument('--shards', type=int, default=None, help='import worker processes')
+    parser.add_argument('--compress', action='store_true', help='have the stub gzip its larger responses')
+    parser.add_argument('--catalog', type=int, default=10000, help='stub products listed for a product mirror')
+    parser.add_argument('--capacity', type=int, default=0, help='stub calls worked on at once, 0 for no limit')
+    parser.add_argument('--trace', action='store_true', help='print the time spent in each phase of each run')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip peak memory tracing, which slows the client down noticeably')
+    parser.add_argument('--json', default='', help='write the results to this file')
+    parser.add_argument('--compare', default='', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, kwargs={
+        'ready': ready, 'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+        'http_error_rate': args.http_error_rate, 'seed': 1, 'compress': args.compress,
+        'catalog': args.catalog, 'capacity': args.capacity}, daemon=True)
+    server.start()
+    endpoint = 'http://127.0.0.1:%d/rest/sxapirestservice/' % ready.get(timeout=10)
+
+    wanted = [name for name in args.scenarios.split(',') if name]
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            for name, make_rows, call in scenarios(args):
+                if wanted and name not in wanted:
+                    continue
+                results.append(run_one(endpoint, name, make_rows, call, size, not args.no_memory, args.trace))
+    finally:
+        server.terminate()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
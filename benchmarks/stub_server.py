@@ -0,0 +1,237 @@
+"""
+    Local stand-in for the SXAPI REST service, used by the benchmark harness.
+
+    Implements the calls py_sxapi makes with canned responses:
+        sxapiicgetproductlistv2, sxapiicgetwhseproductdatageneralv2, sxapiicgetproductdatageneralv3,
+        sxapiicproductmnt, sxapiarcustomermnt, sxapipdpricingmnt, sxapioepricing
+    Products whose code ends in an even digit exist, everything else does not, and products added
+    through sxapiicproductmnt exist from then on. sxapiicgetproductlistv2 with a recordLimit lists
+    the products whose code starts with productCode, out of the even BENCHnnnnnnn codes below
+    --catalog and the added ones, every product being set up in every warehouse. gzip and deflate request bodies are accepted, and
+    responses can be gzipped with --compress. GET ?_wadl serves a WADL listing these calls, with an
+    ETag. Every call can be slowed down with a fixed latency plus jitter, and a share of calls can be
+    failed with an HTTP 500 or a cErrorMessage. --capacity limits how many calls are worked on at once,
+    like the agents of a Progress app server: further calls queue, and their latency grows. A
+    maintenance batch holding the field value POISON is rejected as a whole, with a cErrorMessage and no
+    returnData, like a row that fails the app server's validation of the batch.
+
+    Run on its own with:
+        python benchmarks/stub_server.py --port 8185 --latency 0.01
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def product_exists(product):
+    product = str(product)
+    return product[-1:].isdigit() and int(product[-1]) % 2 == 0
+
+
+class StubState:
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, http_error_rate=0.0, seed=None, compress=False,
+                 catalog=10000, capacity=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.compress = compress
+        self.catalog = catalog
+        self.agents = threading.BoundedSemaphore(capacity) if capacity > 0 else None
+        self.random = random.Random(seed)
+        self.added = set()
+        self.lock = threading.Lock()
+
+    def delay(self):
+        wait = self.latency
+        if self.jitter:
+            with self.lock:
+                wait += self.random.uniform(0, self.jitter)
+        if wait > 0 and self.agents is not None:
+            with self.agents:
+                time.sleep(wait)
+        elif wait > 0:
+            time.sleep(wait)
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+
+def mnt_response(state, changes):
+    sets = sorted({change['setNo'] for change in changes})
+    errors = ''
+    if state.roll(state.error_rate):
+        errors = 'Set %s: Invalid field value (stub)' % sets[0]
+    return {'cErrorMessage': errors,
+            'returnData': '|'.join('Set %s updated' % set_no for set_no in sets)}
+
+
+def product_list(state, prefix, limit):
+    with state.lock:
+        added = {product for product in state.added if isinstance(product, str)}
+    products = sorted(added.union('BENCH%07d' % i for i in range(0, state.catalog, 2)))
+    products = [product for product in products if product.startswith(prefix)]
+    return {'cErrorMessage': '', 'moreRecords': len(products) > limit,
+            'tProdv2': {'t-prodv2': [{'prod': product} for product in products[:limit]]}}
+
+
+def handle(state, function, request):
+    if function == 'sxapiicgetproductlistv2' and 'recordLimit' in request:
+        return product_list(state, request['productCode'], int(request['recordLimit']))
+
+    if function == 'sxapiicgetproductlistv2':
+        product = request['productCode']
+        found = product_exists(product) or product in state.added
+        return {'cErrorMessage': '', 'tProdv2': {'t-prodv2': [{'prod': product}] if found else []}}
+
+    if function == 'sxapiicgetwhseproductdatageneralv2':
+        product = request['product']
+        if state.roll(state.error_rate):
+            return {'cErrorMessage': 'Record locked (stub)'}
+        if product_exists(product) or (product, request['whse']) in state.added:
+            return {'cErrorMessage': '', 'prod': product, 'whse': request['whse']}
+        return {'cErrorMessage': 'Product/Warehouse Not Set Up in Warehouse Products - ICSW (4602)'}
+
+    if function == 'sxapiicgetproductdatageneralv3':
+        product = request['productCode']
+        return {'cErrorMessage': '', 'prod': product, 'descrip': 'Stub product %s' % product, 'unitStock': 'each'}
+
+    if function == 'sxapiicproductmnt':
+        changes = request['tMntTt']['t-mnt-tt']
+        with state.lock:
+            for change in changes:
+                if change['updateMode'] == 'add':
+                    state.added.add(change['key1'])
+                    state.added.add((change['key1'], change['key2']))
+        return mnt_response(state, changes)
+
+    if function in ('sxapiarcustomermnt', 'sxapipdpricingmnt'):
+        return mnt_response(state, request['tMntTt']['t-mnt-tt'])
+
+    if function == 'sxapioepricing':
+        seed = sum(map(ord, str(request['productCode']))) + int(float(request['quantity']))
+        return {'cErrorMessage': '', 'price': round(seed * 1.37 % 500, 2), 'discountAmount': 0,
+                'discountType': '', 'netAvailable': seed % 40}
+
+    return None
+
+
+FUNCTIONS = ['sxapiicgetproductlistv2', 'sxapiicgetwhseproductdatageneralv2', 'sxapiicgetproductdatageneralv3',
+             'sxapiicproductmnt', 'sxapiarcustomermnt', 'sxapipdpricingmnt', 'sxapioepricing']
+
+WADL = ('<?xml version="1.0" encoding="UTF-8"?>'
+        '<application xmlns="http://wadl.dev.java.net/2009/02">'
+        '<resources base="/rest/sxapirestservice/">'
+        + ''.join('<resource path="/%s"><method name="POST" id="%s"><request>'
+                  '<representation mediaType="application/json"/></request></method></resource>' % (name, name)
+                  for name in FUNCTIONS)
+        + '</resources></application>').encode('utf-8')
+WADL_ETAG = '"stub-%d"' % len(WADL)
+
+
+def make_handler(state):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # send headers and body in one segment, otherwise delayed ACKs add ~40ms to every call
+        disable_nagle_algorithm = True
+        wbufsize = -1
+
+        def do_GET(self):
+            if not self.path.endswith('?_wadl'):
+                return self.reply(404, b'<html><body>Not found</body></html>', 'text/html')
+            if self.headers.get('If-None-Match') == WADL_ETAG:
+                self.send_response(304)
+                self.send_header('ETag', WADL_ETAG)
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+            self.reply(200, WADL, 'application/vnd.sun.wadl+xml', {'ETag': WADL_ETAG})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+            encoding = self.headers.get('Content-Encoding')
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            elif encoding == 'deflate':
+                body = zlib.decompress(body)
+            payload = json.loads(body or b'{}')
+            function = self.path.rstrip('/').rsplit('/', 1)[-1]
+
+            state.delay()
+            if state.roll(state.http_error_rate):
+                return self.reply(500, b'<html><body>500 Internal Server Error (stub)</body></html>', 'text/html')
+
+            request = payload.get('request', {})
+            if any(change.get('fieldValue') == 'POISON' for change in request.get('tMntTt', {}).get('t-mnt-tt', [])):
+                rejected = {'response': {'cErrorMessage': 'Batch rejected (stub)', 'returnData': ''}}
+                return self.reply(200, json.dumps(rejected).encode('utf-8'), 'application/json')
+
+            response = handle(state, function, request)
+            if response is None:
+                return self.reply(404, b'<html><body>Unknown function</body></html>', 'text/html')
+            self.reply(200, json.dumps({'response': response}).encode('utf-8'), 'application/json')
+
+        def reply(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if state.compress and len(body) >= 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, 6)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, host='127.0.0.1', ready=None, **options):
+    """
+    Runs the stub server until the process is stopped.
+    Input:
+        -port, the port to listen on. 0 picks a free port
+        -ready, an optional multiprocessing queue the bound port is put on once listening
+        -options, latency, jitter, error_rate, http_error_rate, seed, compress, catalog and capacity, see StubState
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(**options)))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8185)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra random seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls answered with a cErrorMessage')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='share of calls answered with HTTP 500')
+    parser.add_argument('--compress', action='store_true', help='gzip responses of 1KB or more when accepted')
+    parser.add_argument('--catalog', type=int, default=10000, help='BENCH products listed by the bulk listing call')
+    parser.add_argument('--capacity', type=int, default=0, help='calls worked on at once, 0 for no limit')
+    args = parser.parse_args()
+
+    print('Stub SXAPI listening on http://%s:%s/rest/sxapirestservice/' % (args.host, args.port))
+    serve(args.port, args.host, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+          http_error_rate=args.http_error_rate, compress=args.compress, catalog=args.catalog,
+          capacity=args.capacity)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-__all__ = ['py_sxapi']
\ No newline at end of file
+__all__ = ['py_sxapi', 'aio']
\ No newline at end of file
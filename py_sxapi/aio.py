@@ -0,0 +1,658 @@
+"""
+    asyncio client for SXAPI calls.
+
+    Mirrors the py_sxapi class on top of aiohttp. A semaphore caps the number of requests in flight
+    against sxapirestservice, so callers can gather hundreds of lookups without flooding the app server.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from itertools import chain
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .batching import AdaptiveBatcher, set_numbers, split_sets, unapplied
+from .cache import PricingCache, ProductDataCache, pricing_cache_from_config, product_cache_from_config
+from .changes import (customer_changes, item_changes, item_keys, iter_item_changes, mnt_results, numbered_changes,
+                      pricing_changes, pricing_defaults, pricing_fields, pricing_item, pricing_row, product_listed,
+                      response_error, warehouse_product_exists)
+from .codec import RequestEncoder, get_codec
+from .columnar import Columns, as_columns
+from .compression import ACCEPT_ENCODING, Compressor
+from .config import client_settings
+from .journal import ImportJournal, journal_from_config
+from .limiter import AdaptiveLimiter
+from .matrix import MATRIX_COLUMNS, MatrixWriter, matrix_row, pricing_grid
+from .metrics import Metrics
+from .retry import CircuitBreaker, CircuitOpenError, RetryPolicy, TransientError, is_write
+from .singleflight import AsyncSingleFlight
+from .tracing import tracer_from_config
+
+
+def unsent(error):
+    """
+    True if a failed call never reached the app server: the connection could not be made, or it answered 429.
+    """
+    if isinstance(error, TransientError):
+        return error.status == 429
+    # ConnectionTimeoutError is only raised by aiohttp 3.10 and later
+    return isinstance(error, (aiohttp.ClientConnectorError, getattr(aiohttp, 'ConnectionTimeoutError', ())))
+
+
+async def gather_in_order(aws):
+    """
+    Like asyncio.gather, but if several awaitables fail the exception of the first one in input order is
+    raised, matching what a serial loop would have raised.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+class AsyncSxapi:
+    _mode = 'prod'
+    _endpoint = ''
+    _credentials = {}
+    _max_in_flight = 100
+    _inflight = 1
+    _pricing_cache = None
+    _product_cache = None
+    _journal = None
+    _limiter = None
+    _bisect = True
+    _tracer = None
+
+    def __init__(self, mode, endpoint='', max_in_flight=None, pricing_cache=None, journal=None, limiter=None,
+                 product_cache=None, tracer=None):
+        """
+        Input:
+            -mode, 'prod' or 'test'. Falls back to the mode in config.ini if empty
+            -endpoint, the base url of the SXAPI REST service. Falls back to config.ini if empty
+            -max_in_flight, the max number of concurrent SXAPI requests. Defaults to the max_in_flight
+            setting in config.ini
+            -pricing_cache, an optional PricingCache used by get_pricing. Defaults to the one described by config.ini
+            -journal, an optional ImportJournal making the imports resumable. Defaults to journal_file in config.ini
+            -product_cache, an optional ProductDataCache used by get_product_data. Defaults to the one described by
+            config.ini
+            -limiter, an optional AdaptiveLimiter capping the requests actually out below max_in_flight. It may be
+            shared with a threaded py_sxapi client. Defaults to the concurrency_* settings in config.ini
+            -tracer, an optional Tracer receiving timing spans for the import and pricing phases and the SXAPI
+            calls, see tracing.py. Defaults to the tracing setting in config.ini
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncSxapi requires aiohttp, install it with: pip install py_sxapi[async]')
+
+        self._mode, self._endpoint, section = client_settings(mode, endpoint)
+
+        if max_in_flight is None:
+            max_in_flight = section.getint('max_in_flight', 100)
+        self._max_in_flight = max_in_flight
+        self._inflight = section.getint('inflight_batches', 1)
+        self._pricing_workers = section.getint('pricing_workers', 8)
+        self._keep_alive = section.getboolean('keep_alive', True)
+        self._timeout = aiohttp.ClientTimeout(sock_connect=section.getfloat('connect_timeout', 5.0),
+                                              sock_read=section.getfloat('read_timeout', 60.0))
+        self._session = None
+        self._semaphore = None
+        self._metrics = Metrics()
+        self._encoder = RequestEncoder(get_codec(section.get('json_codec', 'auto')))
+        self._compressor = Compressor.from_config(section)
+        self._batchers = {function: AdaptiveBatcher.from_config(section)
+                          for function in ['sxapiicproductmnt', 'sxapiarcustomermnt', 'sxapipdpricingmnt']}
+
+        if pricing_cache is None:
+            pricing_cache = pricing_cache_from_config(section)
+        self._pricing_cache = pricing_cache
+
+        if product_cache is None:
+            product_cache = product_cache_from_config(section)
+        self._product_cache = product_cache
+        self._product_flight = AsyncSingleFlight()
+
+        if journal is None:
+            journal = journal_from_config(section)
+        self._journal = journal
+
+        if limiter is None:
+            limiter = AdaptiveLimiter.from_config(section)
+        self._limiter = limiter
+        self._retry = RetryPolicy.from_config(section)
+        self._breaker = CircuitBreaker.from_config(section)
+        self._bisect = section.getboolean('bisect_batches', True)
+        if tracer is None:
+            tracer = tracer_from_config(section)
+        self._tracer = tracer
+
+    @property
+    def pricing_cache(self):
+        return self._pricing_cache
+
+    @property
+    def product_cache(self):
+        return self._product_cache
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def tracer(self):
+        return self._tracer
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the pooled connections held by this client.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._max_in_flight, force_close=not self._keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return self._session
+
+    async def send_request(self, function, data, retry=True):
+        """
+        Posts a request to an SXAPI function, waiting for a free slot if max_in_flight requests are already out,
+        or as many as the adaptive concurrency limit allows. Timeouts, connection errors and TransientErrors are
+        retried with jittered exponential backoff while the circuit breaker is closed, see retry.py. Maintenance
+        calls are only retried if they never reached the app server.
+        Input:
+            -function, the SXAPI function name, e.g. sxapiicproductmnt
+            -data, the request payload, either a dictionary or JSON bytes from the client's RequestEncoder
+            -retry, whether the call gets more than one attempt
+        Output: The decoded JSON response
+        """
+        write = is_write(function)
+        attempt = 0
+        while True:
+            self._breaker.before(function)
+            try:
+                with self._tracer.span(function, attempt=attempt):
+                    response_dict = await self._send_once(function, data)
+            except (aiohttp.ClientError, asyncio.TimeoutError, TransientError) as e:
+                self._breaker.failure()
+                delay = None
+                if retry and (not write or unsent(e)):
+                    delay = self._retry.delay(attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                self._breaker.success()
+                raise
+            self._breaker.success()
+            return response_dict
+
+    async def _send_once(self, function, data):
+        session = self._get_session()
+        if isinstance(data, bytes):
+            body = data
+        else:
+            with self._tracer.span('encode'):
+                body = self._encoder.codec.dumps(data)
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': ACCEPT_ENCODING}
+        wire, encoding, seconds = self._compressor.compress(function, body)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            self._metrics.observe_compression(function, 'request', len(body), len(wire), seconds)
+
+        limiter = self._limiter
+        with self._tracer.span('slot_wait'):
+            await self._semaphore.acquire()
+        try:
+            if limiter is not None:
+                with self._tracer.span('limit_wait'):
+                    await limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                with self._tracer.span('network', request_bytes=len(wire)) as span:
+                    async with session.post(self._endpoint + function, data=wire, headers=headers) as response:
+                        content = await response.read()
+                    span.set_attribute('http.status_code', response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                seconds = time.perf_counter() - start
+                self._metrics.observe_exception(function, seconds)
+                if limiter is not None:
+                    limiter.release(seconds, 'overload' if isinstance(e, asyncio.TimeoutError) else 'ignore', function)
+                raise
+            except BaseException:
+                if limiter is not None:
+                    limiter.release(time.perf_counter() - start, 'ignore', function)
+                raise
+            seconds = time.perf_counter() - start
+            if limiter is not None:
+                limiter.release(seconds, 'overload' if response.status >= 500 else 'ok', function)
+            self._metrics.observe(function, seconds, response.status, len(body), len(content))
+            if response.headers.get('Content-Encoding') in ('gzip', 'deflate') and response.content_length:
+                self._metrics.observe_compression(function, 'response', len(content), response.content_length)
+        finally:
+            self._semaphore.release()
+
+        with self._tracer.span('decode', response_bytes=len(content)):
+            return self._decode(function, response.status, content)
+
+    def _decode(self, function, status, content):
+        """
+        Decodes an SXAPI response. See py_sxapi._decode.
+        """
+        if status >= 500 or status == 429:
+            raise TransientError(function, status, content.decode('utf-8', 'replace'))
+        try:
+            response_dict = self._encoder.codec.loads(content)
+        except ValueError:
+            text = content.decode('utf-8', 'replace')
+            if status == 200:
+                raise TransientError(function, status, text)
+            raise ValueError('%s returned HTTP %s: %s' % (function, status, text[:200]))
+        if response_error(response_dict) is not None:
+            self._metrics.observe_error_message(function)
+        return response_dict
+
+    async def check_product(self, product, credentials=None):
+        """
+        Checks for the presence of a product. Uses the sxapiicgetproductlistv2 Call.
+        Output: True if the product exists, false if not.
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        request = self._encoder.request(credentials, productCode=product)
+
+        response_dict = await self.send_request(function='sxapiicgetproductlistv2', data=request)
+
+        return product_listed(product, response_dict)
+
+    async def check_product_warehouse(self, product, warehouse, credentials=None):
+        """
+        Checks for the presence of a product in a particular warehouse. Uses the sxapiicgetwhseproductdatageneralv2
+        Call.
+        Output: True if the product is present, false if not. Fails on any error other than 'Product/Warehouse Not Set Up'
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        request = self._encoder.request(credentials, product=product, whse=warehouse)
+
+        response_dict = await self.send_request(function='sxapiicgetwhseproductdatageneralv2', data=request)
+
+        return warehouse_product_exists(response_dict)
+
+    async def get_product_data(self, product, use_xref=0, credentials=None):
+        """
+        Returns basic data about a product. Uses sxapiicgetproductdatageneralv3
+        Output: a dictionary of product information, passed through from the sxapi call. Served from the product
+        cache if there is one, or shared with an identical call already in flight
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        key = ProductDataCache.key(credentials['cono'], product, use_xref)
+        if self._product_cache is not None:
+            cached = self._product_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+
+        async def fetch():
+            request = self._encoder.request(credentials, productCode=product, useCrossReferenceFlag=use_xref)
+
+            response_dict = await self.send_request(function='sxapiicgetproductdatageneralv3', data=request)
+
+            if self._product_cache is not None and not response_dict['response'].get('cErrorMessage'):
+                self._product_cache.set(key, response_dict['response'])
+            return response_dict['response']
+
+        return dict(await self._product_flight.do(key, fetch))
+
+    async def get_product_data_many(self, products, use_xref=0, credentials=None):
+        """
+        Returns basic data about several products, looking each distinct product up once, concurrently up to
+        max_in_flight at a time. Uses get_product_data
+        Output: a dictionary mapping each product to its dictionary of product information
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        products = list(dict.fromkeys(products))
+
+        results = await gather_in_order([self.get_product_data(product, use_xref, credentials) for product in products])
+
+        return dict(zip(products, results))
+
+    async def resolve_update_modes(self, keys, credentials=None):
+        """
+        Determines whether each (prod, whse) key needs to be added or changed, checking the distinct keys
+        concurrently.
+        Output: A dictionary mapping each (prod, whse) tuple to 'add' or 'chg'
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        keys = list(dict.fromkeys(keys))
+
+        async def check(key):
+            prod, whse = key
+            if whse != '':
+                found = await self.check_product_warehouse(prod, whse, credentials)
+            else:
+                found = await self.check_product(prod, credentials)
+            return 'chg' if found else 'add'
+
+        with self._tracer.span('resolve_update_modes', keys=len(keys)):
+            modes = await gather_in_order([check(key) for key in keys])
+
+        return dict(zip(keys, modes))
+
+    async def item_import(self, file, credentials=None, inflight=None):
+        """
+        Import items based on file input. Uses the sxapiICProductMnt Call. Up to inflight batches
+        (default: inflight_batches in config.ini) are sent at once.
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        with self._tracer.span('item_import'):
+            run, journaled, chg_list = await self._plan_import('sxapiicproductmnt', file, credentials)
+
+            return_dict = {'ErrorMessage': [], 'ReturnData': []}
+
+            results = await self._submit_batches('sxapiicproductmnt', chg_list, credentials, inflight, run)
+            for errors, return_data in chain(journaled, results):
+                if errors is not None:
+                    return_dict['ErrorMessage'].extend(errors)
+                if return_data is not None:
+                    return_dict['ReturnData'].extend(return_data)
+
+            self._finish(run)
+
+            return json.dumps(return_dict)
+
+    async def _plan_import(self, function, file, credentials):
+        """
+        See py_sxapi._plan_import.
+        Output: A tuple of (run fingerprint, journaled (errors, return_data) results, change records to send)
+        """
+        with self._tracer.span('read_input'):
+            table = as_columns(file)
+            if table is not None:
+                run, done, journaled = self._resume(function, table.records())
+            else:
+                rows = list(file)
+                run, done, journaled = self._resume(function, rows)
+
+        if table is not None:
+            update_modes = None
+            if function == 'sxapiicproductmnt':
+                keys = [key for set_no, key in enumerate(table.keys(function), 1) if set_no not in done]
+                update_modes = await self.resolve_update_modes(keys, credentials)
+            return run, journaled, table.changes(function, update_modes, done)
+
+        if function == 'sxapiicproductmnt':
+            pending = [(set_no, row) for set_no, row in enumerate(rows, 1) if set_no not in done]
+            update_modes = await self.resolve_update_modes([item_keys(row) for _, row in pending], credentials)
+            if done:
+                return run, journaled, numbered_changes(lambda rows: iter_item_changes(rows, update_modes), pending)
+            with self._tracer.span('build_changes'):
+                return run, journaled, item_changes(rows, update_modes)
+
+        make_changes = customer_changes if function == 'sxapiarcustomermnt' else pricing_changes
+        with self._tracer.span('build_changes'):
+            return run, journaled, [change for change in make_changes(rows) if change['setNo'] not in done]
+
+    def _resume(self, function, rows):
+        """
+        See py_sxapi._resume.
+        """
+        if self._journal is None:
+            return None, set(), []
+        run = ImportJournal.fingerprint(function, rows)
+        done, journaled = self._journal.completed(run)
+        return run, done, journaled
+
+    def _finish(self, run):
+        if run is not None:
+            self._journal.finish(run)
+
+    async def _submit_batches(self, function, changes, credentials, inflight=None, run=None):
+        """
+        Sends change records to a maintenance call in whole-set batches, with up to inflight batches out at
+        once. See py_sxapi._submit_batches.
+        Output: A list of (errors, return_data) tuples, one per batch, in submission order
+        """
+        batcher = self._batchers[function]
+        if inflight is None:
+            inflight = self._inflight
+
+        results = []
+        pending = deque()
+        try:
+            for batch in batcher.batches(changes):
+                if len(pending) >= max(inflight, 1):
+                    results.append(await pending.popleft())
+                pending.append(asyncio.ensure_future(self._send_batch(function, batch, credentials, batcher, run)))
+            while pending:
+                results.append(await pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return results
+
+    async def _send_batch(self, function, batch, credentials, batcher, run=None):
+        with self._tracer.span('batch', records=len(batch)):
+            errors, return_data = await self._apply_batch(function, batch, credentials, batcher, run=run)
+        return errors, return_data
+
+    async def _apply_batch(self, function, batch, credentials, batcher, retry=True, run=None):
+        """
+        Sends one maintenance batch, splitting it along set boundaries if it is rejected as a whole, and reporting
+        its sets as failed without resending them if it timed out or came back with an HTTP 5xx. With a run
+        fingerprint, those sets are recorded in the journal as pending. See py_sxapi._apply_batch.
+        """
+        with self._tracer.span('encode'):
+            request = self._encoder.mnt_request(credentials, batch)
+
+        start = time.perf_counter()
+        try:
+            errors, return_data = mnt_results(await self.send_request(function=function, data=request, retry=retry))
+        except (asyncio.TimeoutError, TransientError) as e:
+            batcher.failed()
+            if isinstance(e, CircuitOpenError) or not self._bisect:
+                raise
+            sets = set_numbers(batch)
+            if run is not None:
+                self._journal.record_pending(run, sets)
+            return unapplied(sets, e), None
+        batcher.record(len(batch), time.perf_counter() - start, len(request))
+
+        if errors and not return_data and self._bisect:
+            halves = split_sets(batch)
+            if halves is not None:
+                return await self._bisect_batch(function, halves, credentials, batcher, run)
+        if run is not None:
+            self._journal.record(run, batch, errors, return_data)
+        return errors, return_data
+
+    async def _bisect_batch(self, function, halves, credentials, batcher, run=None):
+        errors, return_data = None, None
+        for half in halves:
+            half_errors, half_return_data = await self._apply_batch(function, half, credentials, batcher, retry=False,
+                                                                    run=run)
+            if half_errors is not None:
+                errors = (errors or []) + half_errors
+            if half_return_data is not None:
+                return_data = (return_data or []) + half_return_data
+        return errors, return_data
+
+    async def _single_mnt_import(self, name, function, file, credentials, inflight):
+        with self._tracer.span(name):
+            run, journaled, chg_list = await self._plan_import(function, file, credentials)
+
+            return_dict = {}
+
+            results = await self._submit_batches(function, chg_list, credentials, inflight, run)
+            for errors, return_data in chain(journaled, results):
+                if errors is not None:
+                    return_dict.setdefault('ErrorMessage', []).extend(errors)
+                if return_data is not None:
+                    return_dict.setdefault('ReturnData', []).extend(return_data)
+
+            self._finish(run)
+
+            return json.dumps(return_dict)
+
+    async def customer_import(self, file, credentials=None, inflight=None):
+        """
+        Import customer data based on file input. Uses the sxapiARCustomerMnt Call.
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        return await self._single_mnt_import('customer_import', 'sxapiarcustomermnt', file, credentials, inflight)
+
+    async def pricing_import(self, file, credentials=None, inflight=None):
+        """
+        Import pricing data based on file input. Uses the sxapiPDPricingMnt Call.
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        return await self._single_mnt_import('pricing_import', 'sxapipdpricingmnt', file, credentials, inflight)
+
+    async def get_pricing(self, data, customer_number, ship_to, warehouse, credentials=None):
+        """
+        Prices a list of products for one customer, ship to and warehouse. Uses the sxapiOEPricing Call.
+        The products are priced concurrently, up to max_in_flight at a time.
+        Output: A list of pricing dictionaries in input order, or a single dictionary if only one row was priced
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        customer_number, ship_to, warehouse = pricing_defaults(customer_number, ship_to, warehouse)
+
+        async def price(row):
+            product, unit, qty = pricing_item(row)
+
+            if self._pricing_cache is not None:
+                cache_key = PricingCache.key(credentials['cono'], customer_number, ship_to, warehouse, product, unit,
+                                             qty)
+                cached = self._pricing_cache.get(cache_key)
+                if cached is not None:
+                    return dict(cached)
+
+            with self._tracer.span('encode'):
+                request = self._encoder.request(credentials, **pricing_fields(customer_number, ship_to, warehouse,
+                                                                              product, unit, qty))
+
+            response_dict = await self.send_request(function='sxapioepricing', data=request)
+
+            priced = pricing_row(product, response_dict)
+            if self._pricing_cache is not None and response_error(response_dict) is None:
+                self._pricing_cache.set(cache_key, dict(priced))
+            return priced
+
+        with self._tracer.span('get_pricing') as span:
+            return_dict = await gather_in_order([price(row) for row in data])
+            span.set_attribute('rows', len(return_dict))
+
+        if len(return_dict) == 1:
+            return return_dict[0]
+        else:
+            return return_dict
+
+    async def get_pricing_matrix(self, customers, products, quantities=(1,), warehouse='', credentials=None,
+                                 workers=None, output=None):
+        """
+        Prices every customer x product x quantity break combination at one warehouse, with up to workers calls
+        out at once (default: pricing_workers in config.ini), below max_in_flight. See py_sxapi.get_pricing_matrix.
+        Output: A Columns table with the MATRIX_COLUMNS of matrix.py and one row per distinct cell, in grid order
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+        if workers is None:
+            workers = self._pricing_workers
+
+        warehouse = pricing_defaults('', '', warehouse)[2]
+        cells = pricing_grid(customers, products, quantities)
+
+        async def price(cell):
+            customer_number, ship_to, product, unit, qty = cell
+            if self._pricing_cache is not None:
+                cache_key = PricingCache.key(credentials['cono'], customer_number, ship_to, warehouse, product, unit,
+                                             qty)
+                cached = self._pricing_cache.get(cache_key)
+                if cached is not None:
+                    return matrix_row(cell, warehouse, cached)
+
+            with self._tracer.span('encode'):
+                request = self._encoder.request(credentials, **pricing_fields(customer_number, ship_to, warehouse,
+                                                                              product, unit, qty))
+            try:
+                response_dict = await self.send_request(function='sxapioepricing', data=request)
+                error = response_error(response_dict)
+                if error is not None:
+                    return matrix_row(cell, warehouse, None, error)
+                priced = pricing_row(product, response_dict)
+            except Exception as e:
+                return matrix_row(cell, warehouse, None, str(e) or type(e).__name__)
+
+            if self._pricing_cache is not None:
+                self._pricing_cache.set(cache_key, dict(priced))
+            return matrix_row(cell, warehouse, priced)
+
+        writer = MatrixWriter(output) if output is not None else None
+        rows = []
+
+        def priced(row):
+            rows.append(row)
+            if writer is not None:
+                writer.write(row)
+
+        pending = deque()
+        try:
+            with self._tracer.span('get_pricing_matrix', cells=len(cells)):
+                for cell in cells:
+                    if len(pending) >= max(workers, 1):
+                        priced(await pending.popleft())
+                    pending.append(asyncio.ensure_future(price(cell)))
+                while pending:
+                    priced(await pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+            if writer is not None:
+                writer.close()
+
+        return Columns(MATRIX_COLUMNS, zip(*rows)) if rows else Columns(MATRIX_COLUMNS, [[]] * len(MATRIX_COLUMNS))
@@ -0,0 +1,153 @@
+"""
+    Batching of t-mnt-tt change records for the sxapi*mnt maintenance calls.
+
+    Batches always hold whole sets: every change of a setNo goes out in the same request, so the app
+    server never sees half a row. The batch size is tuned from the latency and payload size of the
+    batches already sent, between the configured min and max. A batch that fails as a whole can be
+    split in two along set boundaries with split_sets.
+"""
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+
+def split_sets(batch):
+    """
+    Splits a batch into two halves with the same number of sets each, give or take one.
+    Output: A tuple of the two lists of change records, or None if the batch holds a single set
+    """
+    sets = [list(group) for _, group in groupby(batch, key=itemgetter('setNo'))]
+    if len(sets) < 2:
+        return None
+    middle = len(sets) // 2
+    return [change for group in sets[:middle] for change in group], \
+        [change for group in sets[middle:] for change in group]
+
+
+def unapplied(sets, error):
+    """
+    Output: The ErrorMessage entries of sets whose batch failed and may or may not have been applied
+    """
+    return ['Set %s: %s (not resent, it may have been applied)' % (set_no, error) for set_no in sets]
+
+
+def set_numbers(batch):
+    """
+    Output: The setNo values of a batch, in order
+    """
+    return [set_no for set_no, _ in groupby(change['setNo'] for change in batch)]
+
+
+class AdaptiveBatcher:
+    _min_size = 25
+    _max_size = 1000
+    _target_latency = 5.0
+    _max_bytes = 2000000
+
+    def __init__(self, size=100, min_size=25, max_size=1000, target_latency=5.0, max_bytes=2000000):
+        """
+        Input:
+            -size, the number of changes in the first batch
+            -min_size, the smallest batch size the tuning will go down to
+            -max_size, the largest batch size the tuning will go up to
+            -target_latency, seconds a batch may take before the size is cut. None for no limit
+            -max_bytes, the largest request payload a batch may produce. None for no limit
+        """
+        self._min_size = min_size
+        self._max_size = max_size
+        self._target_latency = target_latency
+        self._max_bytes = max_bytes
+        self.size = max(min_size, min(size, max_size))
+        self._bytes_per_change = 0.0
+        self._best_rate = 0.0
+        self._best_size = self.size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, section):
+        return cls(size=section.getint('batch_size', 100),
+                   min_size=section.getint('batch_min_size', 25),
+                   max_size=section.getint('batch_max_size', 1000),
+                   target_latency=section.getfloat('batch_target_latency', 5.0),
+                   max_bytes=section.getint('batch_max_bytes', 2000000))
+
+    @classmethod
+    def fixed(cls, size):
+        """
+        A batcher that always aims for size changes per batch.
+        """
+        return cls(size=size, min_size=size, max_size=size, target_latency=None, max_bytes=None)
+
+    def limit(self):
+        """
+        The number of changes the next batch may hold, taking the payload size limit into account.
+        """
+        size = self.size
+        if self._bytes_per_change and self._max_bytes is not None:
+            size = min(size, int(self._max_bytes / self._bytes_per_change))
+        return max(size, 1)
+
+    def batches(self, changes):
+        """
+        Groups change records into batches without splitting a setNo. A set larger than the limit is sent
+        on its own.
+        Input:
+            -changes, an iterable of t-mnt-tt dictionaries, ordered by setNo
+        Output: Generator of lists of change records
+        """
+        batch = []
+        for set_no, group in groupby(changes, key=itemgetter('setNo')):
+            group = list(group)
+            if batch and len(batch) + len(group) > self.limit():
+                yield batch
+                batch = []
+            batch.extend(group)
+        if batch:
+            yield batch
+
+    def record(self, changes, seconds, nbytes):
+        """
+        Feeds back how a batch went and adjusts the size of the following batches. The size is halved when
+        a batch ran over target_latency or max_bytes, grown while throughput keeps improving, and moved back
+        to the best size seen when a larger batch turns out slower.
+        Input:
+            -changes, the number of changes in the batch
+            -seconds, how long the call took
+            -nbytes, the size of the request payload
+        """
+        if changes <= 0:
+            return
+
+        with self._lock:
+            self._record(changes, seconds, nbytes)
+
+    def _record(self, changes, seconds, nbytes):
+        per_change = nbytes / changes
+        if self._bytes_per_change:
+            self._bytes_per_change = 0.8 * self._bytes_per_change + 0.2 * per_change
+        else:
+            self._bytes_per_change = per_change
+
+        if (self._target_latency is not None and seconds > self._target_latency) or \
+                (self._max_bytes is not None and nbytes > self._max_bytes):
+            self.size = max(self._min_size, self.size // 2)
+            self._best_rate = 0.0
+            return
+
+        rate = changes / seconds if seconds > 0 else float('inf')
+        if rate >= self._best_rate:
+            self._best_rate = rate
+            self._best_size = self.size
+            self.size = min(self._max_size, int(self.size * 1.25) + 1)
+        elif rate < 0.9 * self._best_rate:
+            self.size = max(self._min_size, self._best_size)
+            # let the best rate age so a slow spell does not pin the size forever
+            self._best_rate *= 0.95
+
+    def failed(self):
+        """
+        Called when a batch times out or errors. Halves the batch size.
+        """
+        with self._lock:
+            self.size = max(self._min_size, self.size // 2)
+            self._best_rate = 0.0
@@ -0,0 +1,183 @@
+"""
+    Size-bounded TTL caches for SXAPI lookups.
+
+    TTLCache keeps the most recently used entries in memory and evicts the least recently used one
+    once maxsize is reached. Entries older than ttl seconds are treated as misses. An optional sqlite
+    file keeps entries across process restarts.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    _maxsize = 10000
+    _ttl = 300.0
+
+    def __init__(self, maxsize=10000, ttl=300.0, path=None):
+        """
+        Input:
+            -maxsize, the max number of entries kept in memory (and on disk)
+            -ttl, seconds an entry stays valid
+            -path, optional sqlite file used to persist entries between runs
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            self._db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Output: The cached value, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._load(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.time() + self._ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            self._evict()
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                                 (json.dumps(key), json.dumps(value), expires))
+                self._db.commit()
+
+    def invalidate(self, predicate):
+        """
+        Drops every entry whose key matches predicate.
+        Output: The number of entries dropped. The disk backend holds every entry kept in memory, so with one
+        configured this is the number of rows deleted from it
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            if self._db is None:
+                return len(keys)
+            stale = [row[0] for row in self._db.execute('SELECT key FROM cache')
+                     if predicate(tuple(json.loads(row[0])))]
+            self._db.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in stale])
+            self._db.commit()
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM cache')
+                self._db.commit()
+
+    def stats(self):
+        """
+        Output: A dictionary of hits, misses, hit_rate and size
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _load(self, key):
+        row = self._db.execute('SELECT value, expires FROM cache WHERE key = ?', (json.dumps(key),)).fetchone()
+        if row is None:
+            return None
+        return row[1], json.loads(row[0])
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM cache WHERE key = ?', (json.dumps(key),))
+            self._db.commit()
+
+    def _evict(self):
+        while len(self._entries) > self._maxsize:
+            key, entry = self._entries.popitem(last=False)
+            if self._db is not None:
+                self._db.execute('DELETE FROM cache WHERE key = ?', (json.dumps(key),))
+
+
+class PricingCache(TTLCache):
+    """
+    Caches sxapiOEPricing results keyed on (company, customer, shipTo, warehouse, product, unit, qty).
+    """
+
+    @staticmethod
+    def key(cono, customer_number, ship_to, warehouse, product, unit, qty):
+        return (cono, customer_number, ship_to, warehouse, product, unit, qty)
+
+    def invalidate_product(self, product):
+        return self.invalidate(lambda key: key[4] == product)
+
+    def invalidate_customer(self, customer_number, ship_to=None):
+        if ship_to is None:
+            return self.invalidate(lambda key: key[1] == customer_number)
+        return self.invalidate(lambda key: key[1] == customer_number and key[2] == ship_to)
+
+
+class ProductDataCache(TTLCache):
+    """
+    Caches sxapiICGetProductDataGeneralV3 results keyed on (company, product, use_xref). Meant for a short ttl,
+    to absorb bursts of lookups for the same products.
+    """
+
+    @staticmethod
+    def key(cono, product, use_xref):
+        return (cono, product, use_xref)
+
+    def invalidate_product(self, product):
+        return self.invalidate(lambda key: key[1] == product)
+
+
+def product_cache_from_config(section):
+    """
+    Builds the ProductDataCache described by a config.ini section, or None if product_cache_size is 0 or missing.
+    """
+    size = section.getint('product_cache_size', 0)
+    if size <= 0:
+        return None
+    return ProductDataCache(maxsize=size, ttl=section.getfloat('product_cache_ttl', 5.0))
+
+
+def pricing_cache_from_config(section):
+    """
+    Builds the PricingCache described by a config.ini section, or None if pricing_cache_size is 0 or missing.
+    """
+    size = section.getint('pricing_cache_size', 0)
+    if size <= 0:
+        return None
+    return PricingCache(maxsize=size, ttl=section.getfloat('pricing_cache_ttl', 300.0),
+                        path=section.get('pricing_cache_file', '') or None)
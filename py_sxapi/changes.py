@@ -0,0 +1,302 @@
+"""
+    Request and response helpers shared by the sync and async SXAPI clients.
+
+    The *_changes functions turn input rows into the t-mnt-tt change records used by the
+    sxapi*mnt maintenance calls. Set numbers follow the row order starting at 1 and sequence
+    numbers follow the column order within each row.
+
+    Change records are Change objects rather than dictionaries. Their seven fields are instance attributes,
+    which CPython stores inline without a dictionary of their own, and the lowercased field names are interned,
+    so a large import holds about half the memory. They read and write like dictionaries (change['setNo']).
+    The JSON codecs encode a record's attribute dictionary as it is, in wire order, so no copy is built per
+    record and the output is the same t-mnt-tt object, byte for byte.
+"""
+import sys
+
+_field_names = {}
+
+
+class Change:
+    """
+    One t-mnt-tt change record.
+    """
+    _fields = ('fieldName', 'fieldValue', 'key1', 'key2', 'seqNo', 'setNo', 'updateMode')
+
+    def __init__(self, fieldName, fieldValue, key1, key2, seqNo, setNo, updateMode):
+        # assigned in wire order, which __dict__ keeps for the codecs
+        self.fieldName = fieldName
+        self.fieldValue = fieldValue
+        self.key1 = key1
+        self.key2 = key2
+        self.seqNo = seqNo
+        self.setNo = setNo
+        self.updateMode = updateMode
+
+    # attribute access, unlike __dict__, leaves the attributes stored inline
+    def __getitem__(self, name):
+        if name not in self._fields:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in self._fields:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, Change):
+            other = other.__dict__
+        return self.__dict__ == other
+
+    def __repr__(self):
+        return 'Change(%r)' % self.__dict__
+
+    def as_dict(self):
+        """
+        Output: A copy of the t-mnt-tt dictionary of the record, keys in wire order
+        """
+        return dict(self.__dict__)
+
+
+def field_name(column):
+    """
+    Output: The lowercased, interned t-mnt-tt fieldName of an input column
+    """
+    name = _field_names.get(column)
+    if name is None:
+        name = _field_names[column] = sys.intern(column.lower())
+    return name
+
+
+def sxapi_request(credentials, **fields):
+    """
+    Builds an SXAPI request payload: the operator credentials followed by the call specific fields.
+    """
+    request = {
+        'companyNumber': credentials['cono'],
+        'operatorInit': credentials['username'],
+        'operatorPassword': credentials['password'],
+    }
+    request.update(fields)
+    return {'request': request}
+
+
+def response_error(response_dict):
+    """
+    Returns the cErrorMessage of a response, or None if it has none or the response is not the usual shape.
+    """
+    try:
+        return response_dict['response']['cErrorMessage'] or None
+    except (KeyError, TypeError):
+        return None
+
+
+def product_listed(product, response_dict):
+    """
+    True if product is in the tProdv2 list of an sxapiICGetProductListV2 response.
+    """
+    return any(item['prod'] == product for item in response_dict['response']['tProdv2']['t-prodv2'])
+
+
+def warehouse_product_exists(response_dict):
+    """
+    True if an sxapiICGetWhseProductDataGeneralV2 response found the ICSW record, False if it is not set up.
+    Raises ValueError on any other error.
+    """
+    if response_dict['response']['cErrorMessage'] == \
+            'Product/Warehouse Not Set Up in Warehouse Products - ICSW (4602)':
+        return False
+    elif response_dict['response']['cErrorMessage'] != '':
+        raise ValueError('Cannot validate ICSW record')
+    else:
+        return True
+
+
+def item_keys(row):
+    """
+    Returns the (key1, key2) pair for an item import row: the product, and the warehouse if the row has one.
+    """
+    if 'whse' in row:
+        return row['prod'], row['whse']
+    return row['prod'], ''
+
+
+def item_changes(rows, update_modes):
+    """
+    Builds sxapiICProductMnt change records.
+    Input:
+        -rows, an iterable of dictionaries keyed by column name. prod is required, whse is optional
+        -update_modes, a dictionary mapping (prod, whse) to 'add' or 'chg', see py_sxapi.resolve_update_modes
+    Output: A list of t-mnt-tt Change records
+    """
+    return list(iter_item_changes(rows, update_modes))
+
+
+def iter_item_changes(rows, update_modes, set_no=1):
+    """
+    Generator version of item_changes. set_no is the set number given to the first row, so that
+    consecutive slices of a file can be numbered as if they were one.
+    """
+    for row in rows:
+        seq_no = 1
+        key1, key2 = item_keys(row)
+        update_mode = update_modes[(key1, key2)]
+
+        for key in row.keys():
+            if key not in ['prod', 'whse']:
+                yield Change(field_name(key), row[key], key1, key2, seq_no, set_no, update_mode)
+                seq_no += 1
+
+        set_no += 1
+
+
+def numbered_changes(make_changes, numbered_rows):
+    """
+    Builds change records for rows that keep the set numbers they had in their file, e.g. the rows of one
+    shard, or the rows an interrupted import had not applied yet.
+    Input:
+        -make_changes, a function building the change records of a list of rows, e.g. customer_changes
+        -numbered_rows, an iterable of (set_no, row) tuples
+    Output: Generator of t-mnt-tt Change records
+    """
+    for set_no, row in numbered_rows:
+        for change in make_changes([row]):
+            change.setNo = set_no
+            yield change
+
+
+def customer_changes(rows):
+    """
+    Builds sxapiARCustomerMnt change records. custno is required, shipto is optional.
+    Output: A list of t-mnt-tt Change records
+    """
+    chg_list = []
+
+    set_no = 1
+    for row in rows:
+        seq_no = 1
+        key1 = row['custno']
+        if 'shipto' in row:
+            key2 = row['shipto']
+        else:
+            key2 = ''
+        for key in row.keys():
+            if key not in ['custno', 'shipto']:
+                chg_list.append(Change(field_name(key), row[key], key1, key2, seq_no, set_no, 'chg'))
+                seq_no += 1
+
+        set_no += 1
+
+    return chg_list
+
+
+def pricing_changes(rows):
+    """
+    Builds sxapiPDPricingMnt change records. Rows without a pdrecno (or with a blank one) are added.
+    Output: A list of t-mnt-tt Change records
+    """
+    chg_list = []
+
+    set_no = 1
+    for row in rows:
+        update_mode = 'chg'
+        seq_no = 1
+        if 'pdrecno' in row.keys():
+            key1 = row['pdrecno']
+            if row['pdrecno'] == '':
+                update_mode = 'add'
+        else:
+            key1 = ''
+            update_mode = 'add'
+        key2 = ''
+        for key in row.keys():
+            if key not in ['pdrecno']:
+                chg_list.append(Change(field_name(key), row[key], key1, key2, seq_no, set_no, update_mode))
+                seq_no += 1
+
+        set_no += 1
+
+    return chg_list
+
+
+def mnt_request(credentials, chg_list):
+    """
+    Wraps change records in the request payload. See ICProductMnt in the SXAPI docs for more information on structure
+    """
+    chg_list = [change.as_dict() if isinstance(change, Change) else change for change in chg_list]
+    return sxapi_request(credentials, tMntTt={'t-mnt-tt': chg_list})
+
+
+def mnt_results(response_dict):
+    """
+    Splits the '|' separated cErrorMessage and returnData of a maintenance response. Empty messages are left out,
+    so a response with an empty cErrorMessage has an empty, falsy errors list.
+    Output: A tuple of (errors, return_data). Either is None when the response did not include it
+    """
+    errors = None
+    return_data = None
+
+    if response_dict['response']['cErrorMessage'] is not None:
+        errors = [error for error in response_dict['response']['cErrorMessage'].split('|') if error]
+
+    if response_dict['response']['returnData'] is not None:
+        return_data = [data for data in response_dict['response']['returnData'].split('|') if data]
+
+    return errors, return_data
+
+
+def pricing_defaults(customer_number, ship_to, warehouse):
+    """
+    Fills in the default customer, ship to and warehouse used when pricing without them.
+    """
+    if customer_number == 0:
+        customer_number = '10008088'
+    if ship_to == '0':
+        ship_to = '1'
+    if warehouse == '':
+        warehouse = '100p'
+    return customer_number, ship_to, warehouse
+
+
+def pricing_item(row):
+    """
+    Returns the (prod, unit, qty) of a pricing row. unit defaults to 'each' and qty to 1.
+    """
+    try:
+        unit = row['unit']
+    except KeyError:
+        unit = 'each'
+
+    try:
+        qty = row['qty']
+    except KeyError:
+        qty = 1
+
+    return row['prod'], unit, qty
+
+
+def pricing_fields(customer_number, ship_to, warehouse, product, unit, qty):
+    """
+    The call specific fields of an sxapiOEPricing request for a single product.
+    """
+    return {'customerNumber': customer_number, 'shipTo': ship_to, 'warehouse': warehouse, 'quantity': qty,
+            'productCode': product, 'unitOfMeasure': unit}
+
+
+def pricing_request(credentials, customer_number, ship_to, warehouse, product, unit, qty):
+    """
+    Builds the sxapiOEPricing request payload for a single product.
+    """
+    return sxapi_request(credentials, **pricing_fields(customer_number, ship_to, warehouse, product, unit, qty))
+
+
+def pricing_row(product, response_dict):
+    """
+    Picks the pricing fields out of an sxapiOEPricing response.
+    """
+    return {'prod': product,
+            'price': response_dict['response']['price'],
+            'discount_amount': response_dict['response']['discountAmount'],
+            'discount_type': response_dict['response']['discountType'],
+            'net_available': response_dict['response']['netAvailable']
+            }
@@ -0,0 +1,203 @@
+"""
+    py-sxapi command line entry point.
+
+    Runs the bulk imports and pricing lookups of the py_sxapi client on CSV files, printing the results as
+    JSON. Only argparse and csv are imported up front; the client and its HTTP stack are loaded once the
+    arguments have been checked, so short cron jobs start quickly.
+
+    Credentials come from --cono/--operator (or SXAPI_CONO/SXAPI_OPERATOR) and the SXAPI_PASSWORD
+    environment variable, so the password does not show up in the process list. Client settings are read
+    from config.ini in the working directory.
+
+    Examples:
+        py-sxapi item-import items.csv --workers 8 --inflight 4
+        py-sxapi --mode test customer-import customers.csv
+        py-sxapi get-pricing products.csv --customer 10008088 --warehouse 100p
+        py-sxapi pricing-matrix customers.csv products.csv --qty 1,10,100 --output grid.parquet --workers 16
+        py-sxapi --trace --profile items.prof.txt item-import items.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+
+def read_rows(path):
+    """
+    Input:
+        -path, a CSV file with a header row, a Parquet file, or '-' for standard input
+    Output: Generator of one dictionary per row, or the Parquet file path, which the imports read as columns
+    """
+    if path.lower().endswith(('.parquet', '.pq')):
+        return path
+    return _read_csv(path)
+
+
+def _read_csv(path):
+    if path == '-':
+        yield from csv.DictReader(sys.stdin)
+        return
+    with open(path, newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='py-sxapi', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', default='', help="'prod' or 'test'. Defaults to the mode in config.ini")
+    parser.add_argument('--endpoint', default='', help='SXAPI REST service url. Defaults to config.ini')
+    parser.add_argument('--cono', default=os.environ.get('SXAPI_CONO', ''), help='SX.e company number')
+    parser.add_argument('--operator', default=os.environ.get('SXAPI_OPERATOR', ''), help='SX.e operator initials')
+    parser.add_argument('--logfile', default='', help='file to log to')
+    parser.add_argument('--debug', action='store_true', help='log request and response payloads')
+    parser.add_argument('--trace', action='store_true',
+                        help='print how long each phase and SXAPI call took to standard error')
+    parser.add_argument('--profile', default='', help='profile the command and write the report to this file')
+    parser.add_argument('--profiler', choices=['cprofile', 'sampling'], default='cprofile',
+                        help='cprofile, or sampling for collapsed stacks of all threads')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    item = commands.add_parser('item-import', help='add or change products (sxapiICProductMnt)')
+    item.add_argument('file', help="CSV or Parquet file, or '-' for CSV on standard input")
+    item.add_argument('--workers', type=int, default=None, help='concurrent add/chg existence checks')
+    item.add_argument('--inflight', type=int, default=None, help='maintenance batches in flight')
+    item.add_argument('--shards', type=int, default=None, help='worker processes the rows are split over')
+    item.add_argument('--delta', action='store_true', default=None,
+                      help='only send fields that changed since the last import (see snapshot_file)')
+    item.add_argument('--no-delta', dest='delta', action='store_false',
+                      help='send every field, even if delta is on in config.ini')
+    item.add_argument('--stream', action='store_true',
+                      help='read the file in windows and print each batch result as a JSON line')
+    item.add_argument('--window', type=int, default=1000, help='rows per window with --stream')
+
+    for name, text in [('customer-import', 'change customers (sxapiARCustomerMnt)'),
+                       ('pricing-import', 'add or change price records (sxapiPDPricingMnt)')]:
+        command = commands.add_parser(name, help=text)
+        command.add_argument('file', help="CSV or Parquet file, or '-' for CSV on standard input")
+        command.add_argument('--inflight', type=int, default=None, help='maintenance batches in flight')
+        command.add_argument('--shards', type=int, default=None, help='worker processes the rows are split over')
+        command.add_argument('--delta', action='store_true', default=None,
+                             help='only send fields that changed since the last import (see snapshot_file)')
+        command.add_argument('--no-delta', dest='delta', action='store_false',
+                             help='send every field, even if delta is on in config.ini')
+
+    pricing = commands.add_parser('get-pricing', help='price products for a customer (sxapiOEPricing)')
+    pricing.add_argument('file', help="CSV file with prod and optional unit and qty columns, or '-'")
+    pricing.add_argument('--customer', default='', help='customer number')
+    pricing.add_argument('--ship-to', default='', help='ship to')
+    pricing.add_argument('--warehouse', default='', help='warehouse')
+
+    matrix = commands.add_parser('pricing-matrix',
+                                 help='price every customer x product x quantity combination (sxapiOEPricing)')
+    matrix.add_argument('customers', help='CSV file with a custno and an optional shipto column')
+    matrix.add_argument('products', help='CSV file with a prod and an optional unit column')
+    matrix.add_argument('--qty', default='1', help='comma separated quantity breaks')
+    matrix.add_argument('--warehouse', default='', help='warehouse')
+    matrix.add_argument('--workers', type=int, default=None, help='concurrent pricing calls')
+    matrix.add_argument('--output', default='',
+                        help='CSV or Parquet file to stream the grid to. Defaults to CSV on standard output')
+
+    return parser
+
+
+def run(args, out=sys.stdout):
+    """
+    Runs a parsed command, profiled and traced if asked to.
+    Output: The process exit status, 1 if an import came back with error messages
+    """
+    tracer = None
+    if args.trace:
+        from .tracing import RecordingTracer
+        tracer = RecordingTracer()
+
+    try:
+        if args.profile:
+            from .profiling import profiled
+            with profiled(args.profile, args.profiler):
+                return _run(args, out, tracer)
+        return _run(args, out, tracer)
+    finally:
+        if tracer is not None:
+            sys.stderr.write(tracer.report() + '\n')
+
+
+def _run(args, out, tracer):
+    from .py_sxapi import py_sxapi
+
+    credentials = {'cono': args.cono, 'username': args.operator, 'password': os.environ.get('SXAPI_PASSWORD', '')}
+    if args.command == 'pricing-matrix':
+        return _pricing_matrix(args, out, tracer, credentials)
+
+    rows = read_rows(args.file)
+    if isinstance(rows, str) and (args.command == 'get-pricing' or getattr(args, 'stream', False)):
+        from .columnar import as_columns
+        rows = as_columns(rows).rows()
+
+    with py_sxapi(args.mode, args.endpoint, logfile=args.logfile, debug=args.debug, tracer=tracer) as client:
+        if args.command == 'get-pricing':
+            result = client.get_pricing(rows, args.customer, args.ship_to, args.warehouse, credentials)
+            if isinstance(result, dict):
+                result = [result]
+            json.dump(result, out)
+            out.write('\n')
+            return 0
+
+        if args.command == 'item-import' and args.stream:
+            status = 0
+            for batch in client.item_import_stream(rows, credentials, window=args.window, workers=args.workers,
+                                                   inflight=args.inflight, delta=args.delta):
+                json.dump(batch, out)
+                out.write('\n')
+                if batch['ErrorMessage']:
+                    status = 1
+            return status
+
+        if args.command == 'item-import':
+            result = client.item_import(rows, credentials, workers=args.workers, inflight=args.inflight,
+                                        shards=args.shards, delta=args.delta)
+        elif args.command == 'customer-import':
+            result = client.customer_import(rows, credentials, inflight=args.inflight, shards=args.shards,
+                                            delta=args.delta)
+        else:
+            result = client.pricing_import(rows, credentials, inflight=args.inflight, shards=args.shards,
+                                           delta=args.delta)
+
+    out.write(result + '\n')
+    return 1 if json.loads(result).get('ErrorMessage') else 0
+
+
+def _pricing_matrix(args, out, tracer, credentials):
+    from .py_sxapi import py_sxapi
+
+    customers = [(row['custno'], row.get('shipto') or '') for row in _read_csv(args.customers)]
+    products = list(_read_csv(args.products))
+    quantities = [qty.strip() for qty in args.qty.split(',') if qty.strip()]
+
+    with py_sxapi(args.mode, args.endpoint, logfile=args.logfile, debug=args.debug, tracer=tracer) as client:
+        grid = client.get_pricing_matrix(customers, products, quantities, args.warehouse, credentials,
+                                         workers=args.workers, output=args.output or None)
+
+    errors = sum(1 for error in grid.column('error') if error)
+    if args.output:
+        json.dump({'cells': len(grid), 'errors': errors, 'output': args.output}, out)
+        out.write('\n')
+    else:
+        writer = csv.writer(out)
+        writer.writerow(grid.names)
+        writer.writerows(zip(*grid.columns))
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.cono or not args.operator or 'SXAPI_PASSWORD' not in os.environ:
+        parser.error('credentials missing: pass --cono and --operator (or set SXAPI_CONO and SXAPI_OPERATOR) '
+                     'and set SXAPI_PASSWORD')
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+    JSON encoding of SXAPI requests and responses.
+
+    Uses orjson or ujson when one is installed and falls back to the stdlib json module otherwise.
+    RequestEncoder keeps the credential part of the request envelope pre-encoded per operator, so
+    each call only encodes its own fields, and maintenance batches are encoded straight to bytes.
+    changes.Change records are encoded from their own attribute dictionary, so encoding a batch does not build
+    a dictionary per record.
+"""
+import json
+
+from .changes import Change
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _default(obj):
+    if type(obj) is Change:
+        return obj.__dict__
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+class Codec:
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(Codec):
+    name = 'ujson'
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False, default=_default).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+def get_codec(name='auto'):
+    """
+    Input:
+        -name, 'orjson', 'ujson', 'json', or 'auto' for the fastest one installed
+    Output: A Codec
+    """
+    if name in ('auto', 'orjson') and orjson is not None:
+        return OrjsonCodec()
+    if name in ('auto', 'ujson') and ujson is not None:
+        return UjsonCodec()
+    if name not in ('auto', 'json'):
+        raise ImportError('JSON codec %s is not installed' % name)
+    return Codec()
+
+
+class RequestEncoder:
+    """
+    Encodes {'request': {companyNumber, operatorInit, operatorPassword, ...fields}} payloads to bytes.
+    """
+
+    def __init__(self, codec=None):
+        if codec is None:
+            codec = get_codec()
+        self.codec = codec
+        self._prefixes = {}
+
+    def _prefix(self, credentials):
+        key = (credentials['cono'], credentials['username'], credentials['password'])
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            envelope = {'request': {'companyNumber': credentials['cono'],
+                                    'operatorInit': credentials['username'],
+                                    'operatorPassword': credentials['password']}}
+            # drop the closing '}}' so call fields can be appended
+            prefix = self._prefixes[key] = self.codec.dumps(envelope)[:-2]
+        return prefix
+
+    def request(self, credentials, **fields):
+        """
+        Output: The encoded request payload, the same JSON as changes.sxapi_request(credentials, **fields)
+        """
+        if not fields:
+            return self._prefix(credentials) + b'}}'
+        return self._prefix(credentials) + b',' + self.codec.dumps(fields)[1:] + b'}'
+
+    def mnt_request(self, credentials, chg_list):
+        """
+        Output: The encoded maintenance payload, the same JSON as changes.mnt_request(credentials, chg_list)
+        """
+        return self._prefix(credentials) + b',"tMntTt":{"t-mnt-tt":' + self.codec.dumps(chg_list) + b'}}}'
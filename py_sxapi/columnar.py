@@ -0,0 +1,151 @@
+"""
+    Columnar input for the maintenance imports.
+
+    item_import, customer_import and pricing_import also accept a table held column by column: a pandas
+    DataFrame, a pyarrow Table, a Parquet file, or a dictionary of equal-length sequences. Each column is
+    converted to a Python list in one call (Series.tolist, ChunkedArray.to_pylist). The change records are
+    built column by column: skipped sets are masked out of every column at once, fieldName and seqNo are
+    worked out once per column, key1, key2, setNo and updateMode once per row, and itertools spreads these
+    arrays over the cells, so the only Python code run per cell is the Change constructor itself. No per-row
+    dictionaries are created. Parquet files are read with only the columns of the file itself, without going
+    through rows.
+
+    pandas and pyarrow are optional; they are only imported for input of their type.
+"""
+import os
+from itertools import chain, compress, cycle, repeat
+
+from .changes import Change, field_name
+
+# key1 and key2 columns of each maintenance function
+MNT_KEYS = {'sxapiicproductmnt': ('prod', 'whse'),
+            'sxapiarcustomermnt': ('custno', 'shipto'),
+            'sxapipdpricingmnt': ('pdrecno', None)}
+
+
+def _each(values, times):
+    # every value repeated times, e.g. a key once per field of its row
+    return chain.from_iterable(map(repeat, values, repeat(times)))
+
+
+def _clean(values):
+    # Arrow nulls come through as None; pandas NaN are filled in before the columns get here
+    if None in values:
+        return ['' if value is None else value for value in values]
+    return values
+
+
+class Columns:
+    """
+    A table held as one Python list per column.
+    """
+
+    def __init__(self, names, columns):
+        """
+        Input:
+            -names, the column names
+            -columns, one sequence of values per column, all the same length. Lists, as tolist and to_pylist
+            give, are used as they are rather than copied
+        """
+        self.names = [str(name) for name in names]
+        self.columns = [_clean(column if isinstance(column, list) else list(column)) for column in columns]
+        lengths = {len(column) for column in self.columns}
+        if len(lengths) > 1:
+            raise ValueError('Columns have different lengths: %s' % sorted(lengths))
+        self._length = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self._length
+
+    def column(self, name, default=''):
+        """
+        Output: The values of column name, or default for every row if the table has no such column
+        """
+        if name in self.names:
+            return self.columns[self.names.index(name)]
+        return [default] * self._length
+
+    def records(self):
+        """
+        Output: Generator of the column names followed by one tuple per row, e.g. for ImportJournal.fingerprint
+        """
+        yield tuple(self.names)
+        yield from zip(*self.columns)
+
+    def rows(self):
+        """
+        Output: Generator of one dictionary per row, as the row-based import paths expect
+        """
+        for values in zip(*self.columns):
+            yield dict(zip(self.names, values))
+
+    def keys(self, function):
+        """
+        Output: A list of the (key1, key2) pair of each row for a maintenance function
+        """
+        key1, key2 = MNT_KEYS[function]
+        if key2 is None or key2 not in self.names:
+            return [(value, '') for value in self.column(key1)]
+        return list(zip(self.column(key1), self.column(key2)))
+
+    def changes(self, function, update_modes=None, skip=()):
+        """
+        Builds the change records of a maintenance function, with the same keys, order and numbering as
+        changes.item_changes, customer_changes and pricing_changes give for the same rows.
+        Input:
+            -function, the SXAPI maintenance function
+            -update_modes, for sxapiicproductmnt, a dictionary mapping (prod, whse) to 'add' or 'chg'
+            -skip, set numbers to leave out, e.g. the sets a journal shows as already applied
+        Output: Iterator of t-mnt-tt Change records
+        """
+        key1, key2 = MNT_KEYS[function]
+        names = [field_name(name) for name in self.names if name not in (key1, key2)]
+        values = [column for name, column in zip(self.names, self.columns) if name not in (key1, key2)]
+        key1s = self.column(key1)
+        key2s = self.column(key2) if key2 is not None else [''] * self._length
+        set_nos = range(1, self._length + 1)
+
+        if skip:
+            kept = [set_no not in skip for set_no in set_nos]
+            values = [list(compress(column, kept)) for column in values]
+            key1s, key2s, set_nos = [list(compress(column, kept)) for column in (key1s, key2s, set_nos)]
+
+        if function == 'sxapiicproductmnt':
+            modes = [update_modes[key] for key in zip(key1s, key2s)]
+        elif function == 'sxapiarcustomermnt':
+            modes = ['chg'] * len(set_nos)
+        else:
+            modes = ['add' if key == '' else 'chg' for key in key1s]
+
+        width = len(names)
+        return map(Change, cycle(names), chain.from_iterable(zip(*values)), _each(key1s, width),
+                   _each(key2s, width), cycle(range(1, width + 1)), _each(set_nos, width), _each(modes, width))
+
+
+def as_columns(data):
+    """
+    Input:
+        -data, the file argument of an import
+    Output: A Columns for a pandas DataFrame, pyarrow Table, Parquet file path or dictionary of columns,
+    or None for anything else (an iterable of row dictionaries)
+    """
+    if isinstance(data, Columns):
+        return data
+    if isinstance(data, dict):
+        return Columns(data.keys(), data.values())
+    if isinstance(data, (str, os.PathLike)):
+        if not str(data).lower().endswith(('.parquet', '.pq')):
+            return None
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Reading Parquet files requires pyarrow, install it with: pip install py_sxapi[columnar]')
+        data = pq.read_table(data)
+
+    module = type(data).__module__.split('.')[0]
+    if module == 'pandas' and hasattr(data, 'columns'):
+        data = data.fillna('')
+        return Columns(data.columns, [data[name].tolist() for name in data.columns])
+    if module == 'pyarrow' and hasattr(data, 'column_names'):
+        return Columns(data.column_names, [data.column(name).to_pylist() for name in data.column_names])
+    return None
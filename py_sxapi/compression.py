@@ -0,0 +1,60 @@
+"""
+    Optional compression of SXAPI request bodies.
+
+    Only functions listed in compress_requests (config.ini) are compressed, since not every
+    sxapirestservice deployment accepts a Content-Encoding on requests. Compressed responses are
+    negotiated through Accept-Encoding and decoded by the HTTP client.
+"""
+import time
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class Compressor:
+    _encoding = 'gzip'
+    _level = 6
+    _min_bytes = 1024
+
+    def __init__(self, functions=(), encoding='gzip', level=6, min_bytes=1024):
+        """
+        Input:
+            -functions, the SXAPI function names whose request bodies are compressed
+            -encoding, 'gzip' or 'deflate'
+            -level, the zlib compression level, 1 (fastest) to 9 (smallest)
+            -min_bytes, bodies smaller than this are sent as is
+        """
+        if encoding not in ('gzip', 'deflate'):
+            raise ValueError('Unsupported request encoding %s' % encoding)
+        self._functions = frozenset(functions)
+        self._encoding = encoding
+        self._level = level
+        self._min_bytes = min_bytes
+
+    @classmethod
+    def from_config(cls, section):
+        functions = [name.strip() for name in section.get('compress_requests', '').split(',') if name.strip()]
+        return cls(functions,
+                   encoding=section.get('compress_encoding', 'gzip'),
+                   level=section.getint('compress_level', 6),
+                   min_bytes=section.getint('compress_min_bytes', 1024))
+
+    def compress(self, function, data):
+        """
+        Compresses a request body if function is set up for it.
+        Input:
+            -function, the SXAPI function name
+            -data, the encoded request body
+        Output: A tuple of (body, content_encoding, seconds). content_encoding is None when data was left as is
+        """
+        if function not in self._functions or len(data) < self._min_bytes:
+            return data, None, 0.0
+
+        import gzip
+        import zlib
+
+        start = time.perf_counter()
+        if self._encoding == 'gzip':
+            body = gzip.compress(data, self._level)
+        else:
+            body = zlib.compress(data, self._level)
+        return body, self._encoding, time.perf_counter() - start
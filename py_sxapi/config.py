@@ -0,0 +1,60 @@
+"""
+    Reads client settings from config.ini.
+
+    Each file is parsed once per process and reparsed only if it changes on disk, so creating many
+    clients does not re-read it every time.
+"""
+import configparser
+import os
+import threading
+
+_configs = {}
+_lock = threading.Lock()
+
+
+def load_config(path='config.ini'):
+    """
+    Parses config.ini. A missing file gives an empty config, so every option falls back to its default.
+    The parsed config is shared between callers and should not be modified.
+    """
+    path = os.path.abspath(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    with _lock:
+        cached = _configs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        config = configparser.ConfigParser()
+        config.read(path)
+        _configs[path] = (mtime, config)
+        return config
+
+
+def client_settings(mode, endpoint='', config=None):
+    """
+    Resolves the mode, endpoint and config section a client should use.
+    Input:
+        -mode, 'prod' or 'test'. Falls back to the mode in the DEFAULT section if empty
+        -endpoint, the base url of the SXAPI REST service. Falls back to the mode's endpoint if empty
+        -config, an already parsed config. Defaults to config.ini in the working directory
+    Output: A tuple of (mode, endpoint, section)
+    """
+    if config is None:
+        config = load_config()
+
+    if not mode:
+        mode = config['DEFAULT']['mode']
+
+    if not endpoint:
+        endpoint = config[mode]['endpoint']
+
+    if config.has_section(mode):
+        section = config[mode]
+    else:
+        section = config['DEFAULT']
+
+    return mode, endpoint, section
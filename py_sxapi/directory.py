@@ -0,0 +1,154 @@
+"""
+    The SXAPI function directory, read from the REST service's WADL.
+
+    The WADL is parsed with a streaming XML parser into {function: HTTP method}. An optional sqlite
+    file keeps the parsed directory per endpoint along with the response's ETag and Last-Modified, so
+    later clients revalidate it with a conditional GET instead of downloading and parsing it again,
+    and skip the request entirely while it is younger than max_age seconds.
+"""
+import json
+import threading
+import time
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_wadl(source):
+    """
+    Input:
+        -source, a file-like object (or file name) holding the WADL document
+    Output: A dictionary mapping each resource path, without its leading '/', to the name of its first method
+    """
+    import xml.etree.ElementTree as ET
+
+    directory = {}
+    depth = 0
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if _local(element.tag) != 'resource':
+            continue
+        if event == 'start':
+            depth += 1
+            continue
+
+        depth -= 1
+        path = element.get('path')
+        if path:
+            method = next((child for child in element.iter() if _local(child.tag) == 'method'), None)
+            if method is not None:
+                directory[path.lstrip('/')] = method.get('name')
+        if depth == 0:
+            element.clear()
+    return directory
+
+
+class DirectoryCache:
+    _max_age = 3600.0
+
+    def __init__(self, path=None, max_age=3600.0):
+        """
+        Input:
+            -path, optional sqlite file the directories are persisted in. Without one they are only
+            kept for the life of the process
+            -max_age, seconds a stored directory is used without revalidating it with the server
+        """
+        self._max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS directory (endpoint TEXT PRIMARY KEY, etag TEXT, '
+                             'last_modified TEXT, functions TEXT, checked REAL)')
+            self._db.commit()
+
+    def get(self, endpoint):
+        """
+        Output: A tuple of (functions, etag, last_modified, checked), or None if endpoint has no stored directory
+        """
+        with self._lock:
+            entry = self._entries.get(endpoint)
+            if entry is None and self._db is not None:
+                row = self._db.execute('SELECT functions, etag, last_modified, checked FROM directory '
+                                       'WHERE endpoint = ?', (endpoint,)).fetchone()
+                if row is not None:
+                    entry = self._entries[endpoint] = (json.loads(row[0]), row[1], row[2], row[3])
+            return entry
+
+    def set(self, endpoint, functions, etag=None, last_modified=None):
+        entry = (functions, etag, last_modified, time.time())
+        with self._lock:
+            self._entries[endpoint] = entry
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO directory VALUES (?, ?, ?, ?, ?)',
+                                 (endpoint, etag, last_modified, json.dumps(functions), entry[3]))
+                self._db.commit()
+
+    def load(self, transport, refresh=False):
+        """
+        Returns the directory of transport's endpoint, from the cache while it is fresh, revalidated with
+        If-None-Match/If-Modified-Since once it is older than max_age, and downloaded and parsed otherwise.
+        Input:
+            -transport, the Transport of the client asking
+            -refresh, revalidate with the server even if the stored directory is fresh
+        Output: A dictionary mapping SXAPI function names to their HTTP method
+        """
+        endpoint = transport.endpoint
+        entry = self.get(endpoint)
+        if entry is not None and not refresh and time.time() - entry[3] < self._max_age:
+            return entry[0]
+
+        headers = {}
+        if entry is not None:
+            if entry[1]:
+                headers['If-None-Match'] = entry[1]
+            if entry[2]:
+                headers['If-Modified-Since'] = entry[2]
+
+        response = transport.get('?_wadl', headers=headers, stream=True)
+        try:
+            if entry is not None and response.status_code == 304:
+                self.set(endpoint, entry[0], entry[1], entry[2])
+                return entry[0]
+            response.raise_for_status()
+            response.raw.decode_content = True
+            functions = parse_wadl(response.raw)
+        finally:
+            response.close()
+
+        self.set(endpoint, functions, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return functions
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_directory_cache(max_age=3600.0):
+    """
+    Output: The in-memory DirectoryCache shared by every client of this process using max_age
+    """
+    with _shared_lock:
+        if max_age not in _shared:
+            _shared[max_age] = DirectoryCache(max_age=max_age)
+        return _shared[max_age]
+
+
+def directory_cache_from_config(section):
+    """
+    Builds the DirectoryCache described by a config.ini section. Without a directory_cache_file, clients
+    share one in-memory cache.
+    """
+    path = section.get('directory_cache_file', '')
+    max_age = section.getfloat('directory_max_age', 3600.0)
+    if not path:
+        return shared_directory_cache(max_age)
+    return DirectoryCache(path, max_age=max_age)
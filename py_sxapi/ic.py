@@ -8,8 +8,10 @@ from __future__ import print_function
 import csv
 import json
 import requests
-import datetime
-from bs4 import BeautifulSoup
+
+from .directory import shared_directory_cache
+from .log import JsonText, get_logger
+from .transport import Transport
 
 class ICService:
     _mode = 'test'
@@ -17,9 +19,9 @@ class ICService:
     _logfile = '/home/dbriggs/environments/sxe_item_import/test_log.log'
     _endpoint = ''
     _credentials = {}
-    _directory = {}
+    _directory = None
     
-    def __init__(self, mode = 'prod', debug=False):
+    def __init__(self, mode = 'prod', debug=False, pool_size=10, connect_timeout=5.0, read_timeout=60.0):
         self._mode = mode
         self._debug = debug  
         
@@ -28,16 +30,18 @@ class ICService:
         else:
             self.endpoint = 'http://psssxe3:8080/rest/sxapirestservice/'
 
+        self._transport = Transport(self.endpoint, pool_size=pool_size, connect_timeout=connect_timeout,
+                                    read_timeout=read_timeout)
+        self._log = get_logger(self._logfile, self._debug)
+
         #Legacy SOAP code, can remove
         """wsdl = 'http://'+web_srv+'/sxapi/ServiceIC.svc?wsdl'    #pull in the WSDL
         client = zeep.Client(wsdl=wsdl)
         self._client = client"""
         #item_import(file)
-    def get_directory(self):
-        response = requests.get(self.endpoint+'?_wadl')
-        soup = BeautifulSoup(response.text, 'lxml')
-        for tag in soup.resources.find_all(path=True):
-            self._directory[tag['path'][1:]] = tag.find('method')['name']
+    def get_directory(self, refresh=False):
+        self._directory = shared_directory_cache().load(self._transport, refresh)
+        return self._directory
 
 
     def create_credentials(self, credentials):
@@ -71,23 +75,18 @@ class ICService:
             'OperatorPassword':credentials['password']}
         return connection_info
 
-    def send_request(self, function, data):
+    def send_request(self, function, data, timeout=None):
 
-        if self._debug and self._logfile != '': #write to log if debug is turned on
-            with open(self._logfile, 'a') as logf:
+        if self._debug: #write to log if debug is turned on
+            self._log.debug('%s request: %s', function, JsonText(data), extra={'function': function})
 
-                logf.write(json.dumps(data))
-                logf.write('\n')
+        response = self._transport.post(function, data, timeout=timeout)
 
-        response = requests.post(self.endpoint+function, json=data)         
-        
-        if response.status_code == requests.codes.ok:
-            with open(self._logfile, 'a') as logf:
-                print(response.text, file=logf)
-        
-        else:
-            with open(self._logfile, 'a') as logf:
-                print(response.text, file=logf)
+        if response.status_code != requests.codes.ok:
+            self._log.warning('%s returned HTTP %s: %s', function, response.status_code, response.text,
+                              extra={'function': function})
+        elif self._debug:
+            self._log.debug('%s response: %s', function, response.text, extra={'function': function})
         return response
 
     def check_product(self, product, credentials=None):
@@ -250,9 +249,8 @@ class ICService:
             return_dict['ReturnData'] = return_data
 
         #print dir(response)
-        if self._logfile != '':
-            with open(self._logfile, 'a') as logf:
-                print("%s: ICProductMnt - %s" % (datetime.datetime.utcnow(), json.dumps(return_dict)), file=logf)
+        if self._debug:
+            self._log.debug('ICProductMnt - %s', JsonText(return_dict))
 
         return json.dumps(return_dict)
 
@@ -290,4 +288,4 @@ request={'InfieldModification':                         #the request payload. Se
 """
 
 #if __name__ == "__main__":
-    #main(mode='test', debug=True)
\ No newline at end of file
+    #main(mode='test', debug=True)
\ No newline at end of file
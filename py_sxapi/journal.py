@@ -0,0 +1,116 @@
+"""
+    Checkpoint journal for resumable bulk imports.
+
+    Each maintenance import is identified by a fingerprint of its SXAPI function and input rows. As
+    batches are acknowledged by the app server, their set numbers and results are written to a small
+    sqlite file. Rerunning the same input against the same journal skips the sets already applied and
+    replays their results, so an import that died halfway continues where it stopped. A run's entries
+    are dropped once the whole import completes, unless some of its batches timed out or failed with an
+    HTTP 5xx: those sets may or may not have been applied, so they are kept as pending, and rerunning the
+    same input sends only them again.
+"""
+import hashlib
+import json
+import threading
+
+
+class ImportJournal:
+
+    def __init__(self, path):
+        """
+        Input:
+            -path, the sqlite file the journal is kept in
+        """
+        import sqlite3
+
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute('CREATE TABLE IF NOT EXISTS batches (run TEXT, first_set INTEGER, sets TEXT, '
+                         'errors TEXT, return_data TEXT, PRIMARY KEY (run, first_set))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS pending (run TEXT, set_no INTEGER, PRIMARY KEY (run, set_no))')
+        self._db.commit()
+
+    @staticmethod
+    def fingerprint(function, rows):
+        """
+        Input:
+            -function, the SXAPI maintenance function the rows are imported with
+            -rows, the input rows, in order
+        Output: A hex digest identifying the import
+        """
+        digest = hashlib.sha256(function.encode('utf-8'))
+        for row in rows:
+            digest.update(json.dumps(row, sort_keys=True, default=str).encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def completed(self, run):
+        """
+        Output: A tuple of (set numbers already applied, list of their (errors, return_data) results in set order)
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT sets, errors, return_data FROM batches WHERE run = ? ORDER BY first_set',
+                                    (run,)).fetchall()
+        done = set()
+        results = []
+        for sets, errors, return_data in rows:
+            done.update(json.loads(sets))
+            results.append((json.loads(errors), json.loads(return_data)))
+        return done, results
+
+    def record(self, run, batch, errors, return_data):
+        """
+        Records an acknowledged batch.
+        Input:
+            -run, the fingerprint of the import
+            -batch, the change records sent
+            -errors, return_data, the batch results, as returned by changes.mnt_results
+        """
+        sets = sorted({change['setNo'] for change in batch})
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?)',
+                             (run, sets[0], json.dumps(sets), json.dumps(errors), json.dumps(return_data)))
+            self._db.executemany('DELETE FROM pending WHERE run = ? AND set_no = ?', [(run, set_no) for set_no in sets])
+            self._db.commit()
+
+    def record_pending(self, run, sets):
+        """
+        Records sets whose batch got no answer, e.g. it timed out, so a rerun sends them again.
+        Input:
+            -run, the fingerprint of the import
+            -sets, the set numbers of the batch
+        """
+        with self._lock:
+            self._db.executemany('INSERT OR IGNORE INTO pending VALUES (?, ?)', [(run, set_no) for set_no in sets])
+            self._db.commit()
+
+    def finish(self, run):
+        """
+        Drops the entries of a completed import, so the same input can be imported again later. If some sets
+        are pending, the entries are kept instead, so that rerunning the import only sends those sets.
+        Output: The pending set numbers, empty if the entries were dropped
+        """
+        with self._lock:
+            pending = [set_no for set_no, in self._db.execute('SELECT set_no FROM pending WHERE run = ? '
+                                                              'ORDER BY set_no', (run,))]
+            if not pending:
+                self._db.execute('DELETE FROM batches WHERE run = ?', (run,))
+                self._db.commit()
+        return pending
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def journal_from_config(section):
+    """
+    Builds the ImportJournal described by a config.ini section, or None if journal_file is empty or missing.
+    """
+    path = section.get('journal_file', '')
+    if not path:
+        return None
+    return ImportJournal(path)
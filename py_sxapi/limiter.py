@@ -0,0 +1,204 @@
+"""
+    Adaptive concurrency limit for SXAPI calls.
+
+    AdaptiveLimiter caps the number of calls out at once, and moves the cap with AIMD: it grows by one
+    for every limit calls that come back while latency stays within tolerance of the lowest latency seen
+    and the limit is actually in use, and is cut by backoff when the smoothed latency rises above that,
+    or a call fails with an HTTP 5xx or a timeout. Latencies are tracked per SXAPI function, as a product
+    check and a maintenance batch take very different times. Cuts are spaced at least limit calls apart,
+    so a burst of failures from calls already out only counts once. The lowest latency slowly drifts up
+    towards the current one so that a lasting change of the app server's speed becomes the new baseline.
+
+    The same limiter serves threads (acquire) and asyncio tasks (acquire_async), so the sync and async
+    clients can share one limit for an app server. Every change of the limit is kept in history.
+"""
+import threading
+import time
+from collections import deque
+
+
+class AdaptiveLimiter:
+    _min_limit = 1
+    _max_limit = 32
+    _tolerance = 2.0
+    _backoff = 0.7
+    _smoothing = 0.2
+    _drift = 0.01
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, tolerance=2.0, backoff=0.7, history=500):
+        """
+        Input:
+            -initial, the limit to start from
+            -min_limit, max_limit, the range the limit is kept in
+            -tolerance, how many times the baseline latency the smoothed latency may reach before the limit is cut
+            -backoff, the factor the limit is multiplied by when it is cut
+            -history, the number of limit changes kept
+        """
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._tolerance = tolerance
+        self._backoff = backoff
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._inflight = 0
+        # function -> [lowest latency, smoothed latency]
+        self._latencies = {}
+        self._since_cut = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._async_waiters = deque()
+        self.history = deque([(time.time(), int(self._limit), 'start')], maxlen=history)
+        self.increases = 0
+        self.decreases = 0
+
+    @classmethod
+    def from_config(cls, section):
+        """
+        Output: The AdaptiveLimiter described by the concurrency_* settings of a config.ini section, or None
+        unless concurrency_limit is on
+        """
+        if not section.getboolean('concurrency_limit', False):
+            return None
+        return cls(initial=section.getint('concurrency_initial', 4),
+                   min_limit=section.getint('concurrency_min', 1),
+                   max_limit=section.getint('concurrency_max', 32),
+                   tolerance=section.getfloat('concurrency_tolerance', 2.0),
+                   backoff=section.getfloat('concurrency_backoff', 0.7))
+
+    def share(self, parts):
+        """
+        Input:
+            -parts, the number of processes calling the same app server, e.g. import shards
+        Output: The constructor arguments of a limiter for one of them, holding an even share of this one's limits
+        """
+        max_limit = max(1, self._max_limit // parts)
+        return {'initial': max(1, min(int(self._limit) // parts, max_limit)),
+                'min_limit': max(1, min(self._min_limit // parts, max_limit)),
+                'max_limit': max_limit,
+                'tolerance': self._tolerance,
+                'backoff': self._backoff}
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def max_limit(self):
+        return self._max_limit
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def acquire(self):
+        """
+        Waits until fewer than limit calls are out, then takes a slot. Pair with release.
+        """
+        with self._cond:
+            while self._inflight >= int(self._limit):
+                self._cond.wait()
+            self._inflight += 1
+
+    async def acquire_async(self):
+        """
+        acquire for asyncio tasks. Waits without blocking the event loop.
+        """
+        import asyncio
+
+        while True:
+            with self._cond:
+                if self._inflight < int(self._limit):
+                    self._inflight += 1
+                    return
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # pass a wake-up this task may have been given on to the next waiter
+                with self._cond:
+                    self._wake()
+                raise
+
+    def release(self, seconds, outcome='ok', function=''):
+        """
+        Gives a slot back and feeds the call's outcome into the limit.
+        Input:
+            -seconds, how long the call took
+            -outcome, 'ok' for a response, 'overload' for an HTTP 5xx or a timeout, or 'ignore' for a call that
+            says nothing about the app server's load, e.g. a connection refused
+            -function, the SXAPI function called, whose latencies seconds is compared with
+        """
+        with self._cond:
+            self._inflight -= 1
+            self._since_cut += 1
+            if outcome == 'ok':
+                self._sample(seconds, function)
+            elif outcome == 'overload':
+                self._cut('overload')
+            self._wake()
+
+    def _sample(self, seconds, function):
+        latency = self._latencies.get(function)
+        if latency is None:
+            latency = self._latencies[function] = [seconds, None]
+        elif seconds < latency[0]:
+            latency[0] = seconds
+        else:
+            latency[0] += (seconds - latency[0]) * self._drift
+        if latency[1] is None:
+            latency[1] = seconds
+        else:
+            latency[1] += (seconds - latency[1]) * self._smoothing
+
+        if latency[1] > self._tolerance * latency[0]:
+            self._cut('latency')
+        elif self._inflight + 1 >= self._limit / 2 and self._limit < self._max_limit:
+            # one step per limit calls, so about one per round trip at full use
+            self._limit = min(self._max_limit, self._limit + 1.0 / self._limit)
+            if int(self._limit) != self.history[-1][1]:
+                self.increases += 1
+                self.history.append((time.time(), int(self._limit), 'increase'))
+
+    def _cut(self, reason):
+        if self._since_cut < int(self._limit):
+            return
+        self._since_cut = 0
+        limit = max(self._min_limit, int(self._limit * self._backoff))
+        # measure the new limit's latencies from scratch
+        for latency in self._latencies.values():
+            latency[1] = None
+        if limit != int(self._limit):
+            self.decreases += 1
+            self.history.append((time.time(), limit, reason))
+        self._limit = float(limit)
+
+    def _wake(self):
+        free = int(self._limit) - self._inflight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        while free > 0 and self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            if not waiter.done():
+                loop.call_soon_threadsafe(_resolve, waiter)
+                free -= 1
+
+    def stats(self):
+        """
+        Output: A dictionary of the current limit, calls in flight, the lowest and smoothed latencies in seconds
+        of each function, the number of increases and decreases, and the history of (time, limit, reason) changes
+        """
+        with self._cond:
+            return {'limit': int(self._limit),
+                    'inflight': self._inflight,
+                    'min_limit': self._min_limit,
+                    'max_limit': self._max_limit,
+                    'latency': {function: tuple(latency) for function, latency in self._latencies.items()},
+                    'increases': self.increases,
+                    'decreases': self.decreases,
+                    'history': list(self.history)}
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
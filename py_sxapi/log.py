@@ -0,0 +1,122 @@
+"""
+    Logging backend for the SXAPI clients.
+
+    Log records are put on a queue by the calling thread and written by a background
+    QueueListener to a size-rotated file, so SXAPI calls never wait on file opens or writes.
+    One listener is kept per log file and shared by every client writing to it.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+
+logging.getLogger('py_sxapi').addHandler(logging.NullHandler())
+
+_listeners = {}
+_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line. The SXAPI function name is included when the
+    record was logged with extra={'function': ...}.
+    """
+
+    def format(self, record):
+        line = {'time': self.formatTime(record), 'level': record.levelname, 'message': record.getMessage()}
+        if hasattr(record, 'function'):
+            line['function'] = record.function
+        if record.exc_info:
+            line['exception'] = self.formatException(record.exc_info)
+        return json.dumps(line)
+
+
+class JsonText:
+    """
+    Defers json.dumps of a log argument until the record is actually formatted, so payloads are not
+    serialized for records the logger's level filters out.
+    """
+    __slots__ = ['_data']
+
+    def __init__(self, data):
+        self._data = data
+
+    def __str__(self):
+        if isinstance(self._data, bytes):
+            return self._data.decode('utf-8', 'replace')
+        return json.dumps(self._data)
+
+
+def get_logger(logfile='', debug=False, max_bytes=10485760, backups=5, json_lines=False):
+    """
+    Returns the logger a client should write to.
+    Input:
+        -logfile, the file to log to. Without one, records go to the standard 'py_sxapi' logger, set to INFO
+        unless its level was already set, or to DEBUG with debug
+        -debug, log request and response payloads as well
+        -max_bytes, the size at which the log file is rotated
+        -backups, the number of rotated files kept
+        -json_lines, write one JSON object per record instead of plain text
+    Output: A logging.Logger
+    """
+    if not logfile:
+        logger = logging.getLogger('py_sxapi')
+        # an explicit level, so the records do not depend on whatever level the root logger happens to have
+        if debug:
+            logger.setLevel(logging.DEBUG)
+        elif logger.level == logging.NOTSET:
+            logger.setLevel(logging.INFO)
+        return logger
+
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    path = os.path.abspath(logfile)
+    logger = logging.getLogger('py_sxapi.file.%s' % path)
+    logger.propagate = False
+
+    with _lock:
+        if path not in _listeners:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+            if json_lines:
+                handler.setFormatter(JsonLinesFormatter())
+            else:
+                handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s'))
+
+            log_queue = queue.Queue(-1)
+            listener = QueueListener(log_queue, handler)
+            listener.start()
+            _listeners[path] = listener
+
+            for old in list(logger.handlers):
+                logger.removeHandler(old)
+            logger.addHandler(QueueHandler(log_queue))
+
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    elif logger.level == logging.NOTSET or logger.level > logging.INFO:
+        logger.setLevel(logging.INFO)
+
+    return logger
+
+
+def logger_from_config(logfile, debug, section):
+    """
+    Builds the client logger using the log_* settings of a config.ini section.
+    """
+    return get_logger(logfile, debug,
+                      max_bytes=section.getint('log_max_bytes', 10485760),
+                      backups=section.getint('log_backups', 5),
+                      json_lines=section.getboolean('log_json', False))
+
+
+@atexit.register
+def flush():
+    """
+    Stops the background writers, writing out every queued record. Runs automatically at exit.
+    """
+    with _lock:
+        for listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
@@ -0,0 +1,130 @@
+"""
+    Customer x product x quantity pricing grids for get_pricing_matrix.
+
+    pricing_grid expands the customers, products and quantity breaks into the distinct cells to price, in
+    grid order: customer by customer, product by product, quantity by quantity. Every cell comes back as one
+    row with the same MATRIX_COLUMNS, whether it was priced or not: a cell whose call failed or came back
+    with a cErrorMessage has no price fields and the reason in error.
+
+    MatrixWriter streams the rows to a CSV or Parquet file as they are priced, rows_per_write at a time, so
+    a long run that is stopped leaves the cells priced so far behind. Parquet needs pyarrow.
+"""
+import csv
+
+MATRIX_COLUMNS = ['custno', 'shipto', 'whse', 'prod', 'unit', 'qty', 'price', 'discount_amount', 'discount_type',
+                  'net_available', 'error']
+
+PRICE_COLUMNS = ['price', 'discount_amount', 'discount_type', 'net_available']
+
+
+def _customer(customer):
+    if isinstance(customer, (tuple, list)):
+        customer_number, ship_to = customer
+    else:
+        customer_number, ship_to = customer, ''
+    return str(customer_number).strip(), str(ship_to).strip()
+
+
+def _product(product):
+    if isinstance(product, dict):
+        return str(product['prod']).strip(), product.get('unit') or 'each'
+    return str(product).strip(), 'each'
+
+
+def pricing_grid(customers, products, quantities=(1,)):
+    """
+    Input:
+        -customers, customer numbers, or (customer number, ship to) tuples
+        -products, product codes, or dictionaries with a prod and an optional unit column
+        -quantities, the quantity breaks to price each product at
+    Output: A list of the distinct (customer number, ship to, product, unit, qty) cells, in grid order
+    """
+    customers = list(dict.fromkeys(_customer(customer) for customer in customers))
+    products = list(dict.fromkeys(_product(product) for product in products))
+    quantities = list(dict.fromkeys(quantities))
+    return [(customer_number, ship_to, product, unit, qty)
+            for customer_number, ship_to in customers
+            for product, unit in products
+            for qty in quantities]
+
+
+def matrix_row(cell, warehouse, priced, error=''):
+    """
+    Input:
+        -cell, a (customer number, ship to, product, unit, qty) tuple of pricing_grid
+        -priced, the changes.pricing_row of the cell, or None if it could not be priced
+        -error, why the cell could not be priced
+    Output: The values of the cell's row, in MATRIX_COLUMNS order
+    """
+    customer_number, ship_to, product, unit, qty = cell
+    if priced is None:
+        prices = (None,) * len(PRICE_COLUMNS)
+    else:
+        prices = tuple(priced[name] for name in PRICE_COLUMNS)
+    return (customer_number, ship_to, warehouse, product, unit, qty) + prices + (error,)
+
+
+class MatrixWriter:
+    _rows_per_write = 10000
+
+    def __init__(self, path, rows_per_write=10000):
+        """
+        Input:
+            -path, the file to write. .parquet or .pq files are written as Parquet, anything else as CSV
+            -rows_per_write, the number of rows buffered before they are written out
+        """
+        self._rows_per_write = rows_per_write
+        self._rows = []
+        self._csv = None
+        self._parquet = None
+        if str(path).lower().endswith(('.parquet', '.pq')):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError('Writing Parquet files requires pyarrow, install it with: '
+                                  'pip install py_sxapi[columnar]')
+            self._schema = pa.schema([(name, pa.string()) for name in MATRIX_COLUMNS[:5]]
+                                     + [('qty', pa.float64()), ('price', pa.float64()),
+                                        ('discount_amount', pa.float64()), ('discount_type', pa.string()),
+                                        ('net_available', pa.float64()), ('error', pa.string())])
+            self._pa = pa
+            self._parquet = pq.ParquetWriter(str(path), self._schema)
+        else:
+            self._file = open(path, 'w', newline='')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(MATRIX_COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self._rows_per_write:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        if self._parquet is not None:
+            columns = [list(column) for column in zip(*self._rows)]
+            for i, field in enumerate(self._schema):
+                if field.type == self._pa.float64():
+                    columns[i] = [None if value in (None, '') else float(value) for value in columns[i]]
+                else:
+                    columns[i] = [None if value is None else str(value) for value in columns[i]]
+            self._parquet.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+        else:
+            self._csv.writerows(['' if value is None else value for value in row] for row in self._rows)
+            self._file.flush()
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        if self._parquet is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
@@ -0,0 +1,295 @@
+"""
+    Per-SXAPI-function call metrics.
+
+    Every call made through send_request is counted per function with its latency, HTTP status,
+    request/response sizes and whether the response carried a cErrorMessage. Metrics.snapshot gives
+    the numbers as a dictionary and Metrics.to_prometheus in the Prometheus text format.
+"""
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Percentiles are interpolated within the bucket they fall in.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def percentile(self, q):
+        """
+        Input:
+            -q, the percentile wanted, between 0 and 100
+        Output: The estimated value at q, or None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def _ratio(raw, wire):
+    return round(wire / float(raw), 4) if raw else None
+
+
+class FunctionMetrics:
+
+    def __init__(self):
+        self.calls = 0
+        self.exceptions = 0
+        self.error_messages = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        # raw and on-the-wire sizes of the compressed bodies only
+        self.compressed_request_bytes = [0, 0]
+        self.compressed_response_bytes = [0, 0]
+        self.compressed_requests = 0
+        self.compressed_responses = 0
+        self.compress_seconds = 0.0
+        self.status = Counter()
+        self.latency = Histogram()
+
+    def merge(self, other):
+        for name in ['calls', 'exceptions', 'error_messages', 'request_bytes', 'response_bytes', 'compressed_requests',
+                     'compressed_responses', 'compress_seconds']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in ['compressed_request_bytes', 'compressed_response_bytes']:
+            setattr(self, name, [a + b for a, b in zip(getattr(self, name), getattr(other, name))])
+        self.status.update(other.status)
+        self.latency.merge(other.latency)
+
+    def snapshot(self):
+        return {'calls': self.calls,
+                'exceptions': self.exceptions,
+                'error_messages': self.error_messages,
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'compressed_requests': self.compressed_requests,
+                'compressed_responses': self.compressed_responses,
+                'request_compression_ratio': _ratio(*self.compressed_request_bytes),
+                'response_compression_ratio': _ratio(*self.compressed_response_bytes),
+                'compress_seconds': self.compress_seconds,
+                'status': dict(self.status),
+                'latency_sum': self.latency.sum,
+                'latency_p50': self.latency.percentile(50),
+                'latency_p90': self.latency.percentile(90),
+                'latency_p99': self.latency.percentile(99)}
+
+
+class Metrics:
+
+    def __init__(self):
+        self._functions = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        with self._lock:
+            return {'_functions': dict(self._functions)}
+
+    def __setstate__(self, state):
+        self._functions = state['_functions']
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def gauge(self, name, text, read):
+        """
+        Adds a gauge to the Prometheus output, e.g. the current concurrency limit.
+        Input:
+            -name, the metric name, without the prefix
+            -text, the HELP text
+            -read, a callable returning the current value
+        """
+        with self._lock:
+            self._gauges[name] = (text, read)
+
+    def merge(self, other):
+        """
+        Adds the counts of another Metrics, e.g. one sent back by a shard worker process.
+        """
+        with self._lock:
+            for function, metrics in other._functions.items():
+                self._get(function).merge(metrics)
+
+    def _get(self, function):
+        metrics = self._functions.get(function)
+        if metrics is None:
+            metrics = self._functions[function] = FunctionMetrics()
+        return metrics
+
+    def observe(self, function, seconds, status, request_bytes, response_bytes):
+        """
+        Records a completed HTTP call.
+        """
+        with self._lock:
+            metrics = self._get(function)
+            metrics.calls += 1
+            metrics.status[status] += 1
+            metrics.request_bytes += request_bytes
+            metrics.response_bytes += response_bytes
+            metrics.latency.observe(seconds)
+
+    def observe_exception(self, function, seconds):
+        """
+        Records a call that raised before a response came back, e.g. a timeout.
+        """
+        with self._lock:
+            metrics = self._get(function)
+            metrics.calls += 1
+            metrics.exceptions += 1
+            metrics.latency.observe(seconds)
+
+    def observe_compression(self, function, direction, raw_bytes, wire_bytes, seconds=0.0):
+        """
+        Records a compressed request or response body.
+        Input:
+            -direction, 'request' or 'response'
+            -raw_bytes, the body size before compression
+            -wire_bytes, the body size as sent or received
+            -seconds, the time spent compressing it
+        """
+        with self._lock:
+            metrics = self._get(function)
+            if direction == 'request':
+                metrics.compressed_requests += 1
+                sizes = metrics.compressed_request_bytes
+            else:
+                metrics.compressed_responses += 1
+                sizes = metrics.compressed_response_bytes
+            sizes[0] += raw_bytes
+            sizes[1] += wire_bytes
+            metrics.compress_seconds += seconds
+
+    def observe_error_message(self, function):
+        """
+        Records a response that came back with a non-empty cErrorMessage.
+        """
+        with self._lock:
+            self._get(function).error_messages += 1
+
+    def snapshot(self):
+        """
+        Output: A dictionary keyed by SXAPI function name of call counts, status counts, byte totals and
+        latency percentiles in seconds
+        """
+        with self._lock:
+            return {function: metrics.snapshot() for function, metrics in self._functions.items()}
+
+    def histogram(self, function=None):
+        """
+        Output: A copy of the latency Histogram of function, or of all functions merged if function is None
+        """
+        merged = Histogram()
+        with self._lock:
+            for name, metrics in self._functions.items():
+                if function is None or name == function:
+                    merged.merge(metrics.latency)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._functions.clear()
+
+    def to_prometheus(self, prefix='sxapi'):
+        """
+        Output: The metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        def header(name, kind, text):
+            lines.append('# HELP %s_%s %s' % (prefix, name, text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        with self._lock:
+            functions = sorted(self._functions.items())
+
+            for name, (text, read) in sorted(self._gauges.items()):
+                header(name, 'gauge', text)
+                lines.append('%s_%s %s' % (prefix, name, read()))
+
+            header('requests_total', 'counter', 'SXAPI calls by function and HTTP status.')
+            for function, metrics in functions:
+                for status, n in sorted(metrics.status.items()):
+                    lines.append('%s_requests_total{function="%s",status="%s"} %d' % (prefix, function, status, n))
+
+            for name, attr, text in [('exceptions_total', 'exceptions', 'SXAPI calls that raised before a response.'),
+                                     ('error_messages_total', 'error_messages',
+                                      'SXAPI responses with a cErrorMessage.'),
+                                     ('request_bytes_total', 'request_bytes', 'Bytes sent to SXAPI.'),
+                                     ('response_bytes_total', 'response_bytes', 'Bytes received from SXAPI.'),
+                                     ('compressed_requests_total', 'compressed_requests',
+                                      'SXAPI requests sent with a compressed body.'),
+                                     ('compressed_responses_total', 'compressed_responses',
+                                      'SXAPI responses received with a compressed body.')]:
+                header(name, 'counter', text)
+                for function, metrics in functions:
+                    lines.append('%s_%s{function="%s"} %d' % (prefix, name, function, getattr(metrics, attr)))
+
+            header('compress_seconds_total', 'counter', 'Time spent compressing SXAPI request bodies.')
+            for function, metrics in functions:
+                lines.append('%s_compress_seconds_total{function="%s"} %f' % (prefix, function, metrics.compress_seconds))
+
+            header('request_duration_seconds', 'histogram', 'SXAPI call latency.')
+            for function, metrics in functions:
+                cumulative = 0
+                for bound, n in zip(metrics.latency.buckets, metrics.latency.counts):
+                    cumulative += n
+                    lines.append('%s_request_duration_seconds_bucket{function="%s",le="%s"} %d'
+                                 % (prefix, function, bound, cumulative))
+                lines.append('%s_request_duration_seconds_bucket{function="%s",le="+Inf"} %d'
+                             % (prefix, function, metrics.latency.count))
+                lines.append('%s_request_duration_seconds_sum{function="%s"} %f'
+                             % (prefix, function, metrics.latency.sum))
+                lines.append('%s_request_duration_seconds_count{function="%s"} %d'
+                             % (prefix, function, metrics.latency.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+def serve_prometheus(metrics, port=9108, host=''):
+    """
+    Serves metrics.to_prometheus() over HTTP on a background thread.
+    Output: The HTTPServer, call shutdown() on it to stop serving
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,174 @@
+"""
+    Local mirror of ICSP/ICSW keys for the add/chg existence checks of item imports.
+
+    Product codes, and product/warehouse pairs for the configured warehouses, are listed in bulk with
+    sxapiICGetProductListV2, one product code prefix at a time, and kept in dictionaries keyed by product
+    and by (product, warehouse) with the time each key was last seen. A prefix whose listing comes back
+    cut off is split into longer prefixes. The mirror only ever answers 'exists': a key that is missing,
+    or was last seen more than max_age seconds ago, is unknown and is checked live by the client, and
+    what the live checks find is added back. refresh relists the prefixes listed longest ago, and with a
+    refresh interval that runs on a background thread.
+"""
+import logging
+import string
+import threading
+import time
+
+
+class ProductMirror:
+    _page_size = 5000
+    _max_age = 3600.0
+    _refresh_interval = 0.0
+    _refresh_batch = 0
+    _max_prefix = 16
+    _alphabet = string.digits + string.ascii_uppercase + '-'
+
+    def __init__(self, lister, prefixes=('',), warehouses=(), page_size=5000, max_age=3600.0, refresh_interval=0.0,
+                 refresh_batch=0):
+        """
+        Input:
+            -lister, a callable(prefix, warehouse, limit, credentials) returning the product codes listed for
+            prefix (in warehouse, unless that is '') and whether the list was cut off. See py_sxapi.list_products
+            -prefixes, the product code prefixes to mirror. '' mirrors the whole catalog
+            -warehouses, the warehouses whose product/warehouse keys are mirrored as well
+            -page_size, the max number of products asked for per listing call
+            -max_age, seconds after which a key that has not been seen again is checked live
+            -refresh_interval, seconds between background refreshes once loaded. 0 turns them off
+            -refresh_batch, the number of prefixes relisted per background refresh. 0 relists all of them
+        """
+        self._lister = lister
+        self._page_size = page_size
+        self._max_age = max_age
+        self._refresh_interval = refresh_interval
+        self._refresh_batch = refresh_batch
+        self._products = {}
+        self._warehouse_products = {}
+        # (prefix, warehouse) listings and when each was last made, '' being ICSP
+        self._listings = {(prefix, whse): 0.0 for prefix in prefixes for whse in ('',) + tuple(warehouses)}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._credentials = None
+        self._stop = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, credentials):
+        """
+        Lists every prefix the first time it is called, and starts the background refresh if one is set.
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            self._credentials = credentials
+        self.refresh()
+        if self._refresh_interval > 0:
+            self.schedule(self._refresh_interval, self._refresh_batch or None)
+
+    def known(self, keys):
+        """
+        Input:
+            -keys, an iterable of (prod, whse) tuples. whse is '' for ICSP keys
+        Output: The set of keys seen within the last max_age seconds
+        """
+        cutoff = time.time() - self._max_age
+        found = set()
+        with self._lock:
+            for key in keys:
+                prod, whse = key
+                if whse != '':
+                    seen = self._warehouse_products.get((str(prod), str(whse)), 0.0)
+                else:
+                    seen = self._products.get(str(prod), 0.0)
+                if seen > cutoff:
+                    found.add(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def add(self, prod, whse=''):
+        """
+        Records a key found to exist, e.g. by a live check.
+        """
+        now = time.time()
+        with self._lock:
+            if whse != '':
+                self._warehouse_products[(str(prod), str(whse))] = now
+            else:
+                self._products[str(prod)] = now
+
+    def refresh(self, limit=None):
+        """
+        Relists the limit prefixes listed longest ago, or all of them.
+        Output: The number of keys seen
+        """
+        with self._lock:
+            listings = sorted(self._listings, key=self._listings.get)
+        if limit is not None:
+            listings = listings[:limit]
+
+        seen = 0
+        for prefix, whse in listings:
+            products, more = self._lister(prefix, whse, self._page_size, self._credentials)
+            now = time.time()
+            with self._lock:
+                if whse != '':
+                    self._warehouse_products.update(((str(prod), whse), now) for prod in products)
+                else:
+                    self._products.update((str(prod), now) for prod in products)
+                self._listings[(prefix, whse)] = now
+                if more and len(prefix) < self._max_prefix:
+                    del self._listings[(prefix, whse)]
+                    self._listings.update(((prefix + char, whse), 0.0) for char in self._alphabet)
+                    listings.extend((prefix + char, whse) for char in self._alphabet)
+            seen += len(products)
+        return seen
+
+    def schedule(self, interval, limit=None):
+        """
+        Runs refresh(limit) every interval seconds on a daemon thread until stop is called.
+        """
+        self.stop()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.refresh(limit)
+                except Exception:
+                    # entries that could not be relisted age out and are checked live
+                    logging.getLogger('py_sxapi').exception('Product mirror refresh failed')
+
+        threading.Thread(target=run, name='py_sxapi-mirror', daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def stats(self):
+        """
+        Output: A dictionary of hits, misses, hit_rate, and the number of products and product/warehouse keys held
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'products': len(self._products),
+                'warehouse_products': len(self._warehouse_products)}
+
+
+def mirror_from_config(section, lister):
+    """
+    Builds the ProductMirror described by the mirror_* settings of a config.ini section, or None unless mirror is on.
+    """
+    if not section.getboolean('mirror', False):
+        return None
+    prefixes = [prefix.strip() for prefix in section.get('mirror_prefixes', '').split(',')]
+    warehouses = [whse.strip() for whse in section.get('mirror_warehouses', '').split(',') if whse.strip()]
+    return ProductMirror(lister, prefixes=[prefix for prefix in prefixes if prefix] or [''], warehouses=warehouses,
+                         page_size=section.getint('mirror_page_size', 5000),
+                         max_age=section.getfloat('mirror_max_age', 3600.0),
+                         refresh_interval=section.getfloat('mirror_refresh_interval', 0.0),
+                         refresh_batch=section.getint('mirror_refresh_batch', 0))
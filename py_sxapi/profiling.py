@@ -0,0 +1,107 @@
+"""
+    Opt-in profiling of a single import or pricing run.
+
+    profiled runs cProfile or a sampling profiler around the code in its with block and writes a report:
+
+        with profiled('item_import.txt'):
+            client.item_import(rows, credentials)
+
+    cProfile counts every Python call, which slows the run down, and only sees the thread that entered the
+    block, so with workers or inflight above 1 the existence checks and batches show up as waiting on futures.
+    The sampling profiler looks at the stacks of all threads every interval seconds instead, at little cost,
+    and writes them in the collapsed stack format flamegraph.pl and speedscope read, most common first.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+class SamplingProfiler:
+    _interval = 0.005
+
+    def __init__(self, interval=0.005):
+        """
+        Input:
+            -interval, seconds between samples
+        """
+        self._interval = interval
+        self._stacks = Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='py_sxapi-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                                          code.co_firstlineno)
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stacks(self):
+        """
+        Output: A list of (collapsed stack, samples) tuples, most common first
+        """
+        return self._stacks.most_common()
+
+    def write(self, f):
+        for stack, count in self.stacks():
+            f.write('%s %d\n' % (stack, count))
+
+
+@contextmanager
+def profiled(report, profiler='cprofile', interval=0.005):
+    """
+    Input:
+        -report, the path the report is written to once the block exits
+        -profiler, 'cprofile' for a deterministic profile of the calling thread, sorted by cumulative time,
+        or 'sampling' for collapsed stacks of all threads
+        -interval, seconds between samples of the sampling profiler
+    """
+    if profiler == 'cprofile':
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield profile
+        finally:
+            profile.disable()
+            with open(report, 'w') as f:
+                pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats()
+    elif profiler == 'sampling':
+        sampler = SamplingProfiler(interval)
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            with open(report, 'w') as f:
+                sampler.write(f)
+    else:
+        raise ValueError('Unknown profiler %r, expected cprofile or sampling' % profiler)
@@ -5,14 +5,35 @@
     wsdl: http://pssapps8/sxapi/serviceIC.svc.
 """
 from __future__ import print_function
-import configparser
 import csv
 import json
+import time
+from collections import deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any
 
-import requests
-import datetime
-from bs4 import BeautifulSoup
+from .batching import AdaptiveBatcher, set_numbers, split_sets, unapplied
+from .cache import PricingCache, ProductDataCache, pricing_cache_from_config, product_cache_from_config
+from .changes import (customer_changes, item_changes, item_keys, iter_item_changes, mnt_results, numbered_changes,
+                      pricing_changes, pricing_defaults, pricing_fields, pricing_item, pricing_row, product_listed,
+                      response_error, warehouse_product_exists)
+from .codec import RequestEncoder, get_codec
+from .columnar import Columns, as_columns
+from .config import client_settings, load_config
+from .directory import directory_cache_from_config
+from .journal import ImportJournal, journal_from_config
+from .limiter import AdaptiveLimiter
+from .log import JsonText, logger_from_config
+from .matrix import MATRIX_COLUMNS, MatrixWriter, matrix_row, pricing_grid
+from .metrics import Metrics
+from .mirror import mirror_from_config
+from .retry import CircuitBreaker, CircuitOpenError, RetryPolicy, TransientError, is_write
+from .singleflight import SingleFlight
+from .sharding import import_shard, merge_results, shard_rows
+from .snapshot import SnapshotStore
+from .tracing import tracer_from_config
+from .transport import Transport
 
 
 def chunk(length, data):
@@ -27,39 +48,247 @@ def chunk(length, data):
         yield data[i:i + length]
 
 
+def unsent(error):
+    """
+    True if a failed call never reached the app server: the connection could not be made, or it answered 429.
+    """
+    from requests.exceptions import ConnectTimeout, ConnectionError
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, TransientError):
+        return error.status == 429
+    if isinstance(error, ConnectTimeout):
+        return True
+    if isinstance(error, ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def ichunk(length, iterable):
+    """
+    Like chunk, but for any iterable. Only one chunk is held in memory at a time.
+    Input:
+        -length, the max length of each chunk to be returned
+        -iterable, the elements to be chunked
+    Output: Generator of lists of max length length
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == length:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 class py_sxapi:
     _mode = 'prod'
     _debug = False
     _logfile = ''
     _endpoint = ''
     _credentials = {}
-    _directory = {}
+    _directory = None
+    _workers = 1
+    _inflight = 1
+    _shards = 1
+    _delta = False
+    _pricing_cache = None
+    _product_cache = None
+    _journal = None
+    _snapshot = None
+    _mirror = None
+    _limiter = None
+    _bisect = True
+    _tracer = None
     
-    def __init__(self, mode, endpoint='', logfile='', debug=False):
+    def __init__(self, mode, endpoint='', logfile='', debug=False, pricing_cache=None, journal=None, snapshot=None,
+                 mirror=None, limiter=None, product_cache=None, tracer=None):
         """
         TODO: Make endpoint and logfile parameters, pull both (as well as mode) from config file if not specified
+        Connection pooling and timeouts are read from the mode's section of config.ini
+        (pool_size, connect_timeout, read_timeout, keep_alive).
+        pricing_cache is an optional PricingCache used by get_pricing. If not given, one is created when
+        pricing_cache_size in config.ini is above 0.
+        journal is an optional ImportJournal that makes item_import, customer_import and pricing_import
+        resumable. If not given, one is opened when journal_file is set in config.ini.
+        snapshot is an optional SnapshotStore used by delta imports. If not given, one is opened on first use,
+        in snapshot_file from config.ini, or in memory if that is not set.
+        mirror is an optional ProductMirror that answers item_import's existence checks locally. If not given,
+        one is created when mirror is on in config.ini (see the mirror_* settings).
+        product_cache is an optional ProductDataCache used by get_product_data. If not given, one is created
+        when product_cache_size in config.ini is above 0. Concurrent identical get_product_data calls share
+        one request whether there is a cache or not.
+        limiter is an optional AdaptiveLimiter every SXAPI call waits on, which may be shared with other
+        clients of the same app server. If not given, one is created when concurrency_limit is on in config.ini
+        (see the concurrency_* settings and limiter.py). With a limiter, workers and inflight default to its
+        max limit and the limiter decides how many calls are really out.
+        Transient failures are retried with backoff behind a circuit breaker, and maintenance batches that
+        fail as a whole are split along set boundaries until the failing sets are isolated (see retry.py and
+        the retry_*, breaker_* and bisect_batches settings).
+        tracer is an optional Tracer receiving timing spans for the phases of the imports and get_pricing and for
+        every SXAPI call (see tracing.py). If not given, the one named by tracing in config.ini is used.
+        Logging goes through a background writer (see log.py). Request and response payloads are only
+        logged, and only serialized, when debug is on.
         """
-        config = configparser.ConfigParser()
-        config.read('config.ini')
+        config = load_config()
+        self._mode, self._endpoint, section = client_settings(mode, endpoint, config)
+
+        self._debug = debug
+        if logfile:
+            self._logfile = logfile
+        elif self._debug:
+            self._logfile = section.get('logfile', '')
+        self._log = logger_from_config(self._logfile, self._debug, section)
+        self._metrics = Metrics()
+        self._encoder = RequestEncoder(get_codec(section.get('json_codec', 'auto')))
+
+        self._workers = section.getint('workers', 1)
+        self._pricing_workers = section.getint('pricing_workers', 8)
+        self._product_workers = section.getint('product_workers', 8)
+        self._inflight = section.getint('inflight_batches', 1)
+        self._shards = section.getint('shards', 1)
+        self._delta = section.getboolean('delta', False)
+        self._snapshot_file = section.get('snapshot_file', '')
+        self._batchers = {function: AdaptiveBatcher.from_config(section)
+                          for function in ['sxapiicproductmnt', 'sxapiarcustomermnt', 'sxapipdpricingmnt']}
+
+        if pricing_cache is None:
+            pricing_cache = pricing_cache_from_config(section)
+        self._pricing_cache = pricing_cache
+
+        if product_cache is None:
+            product_cache = product_cache_from_config(section)
+        self._product_cache = product_cache
+        self._product_flight = SingleFlight()
+
+        if journal is None:
+            journal = journal_from_config(section)
+        self._journal = journal
+
+        self._directory_cache = directory_cache_from_config(section)
+        self._snapshot = snapshot
+
+        if mirror is None:
+            mirror = mirror_from_config(section, self.list_products)
+        self._mirror = mirror
+
+        if limiter is None:
+            limiter = AdaptiveLimiter.from_config(section)
+        self._limiter = limiter
+        # room for every call the thread pools may have out at once, so none waits on the HTTP pool
+        concurrency = [self._workers, self._pricing_workers, self._product_workers, self._inflight]
+        if limiter is not None:
+            concurrency.append(limiter.max_limit)
+        self._transport = Transport.from_config(self._endpoint, section, metrics=self._metrics,
+                                                min_pool_size=max(concurrency))
+        self._retry = RetryPolicy.from_config(section)
+        self._breaker = CircuitBreaker.from_config(section)
+        self._bisect = section.getboolean('bisect_batches', True)
+        if tracer is None:
+            tracer = tracer_from_config(section)
+        self._tracer = tracer
+        if limiter is not None:
+            self._metrics.gauge('concurrency_limit', 'Adaptive limit on concurrent SXAPI calls.',
+                                lambda: limiter.limit)
+            self._metrics.gauge('concurrency_inflight', 'SXAPI calls out under the adaptive limit.',
+                                lambda: limiter.inflight)
+
+    @property
+    def pricing_cache(self):
+        return self._pricing_cache
+
+    @property
+    def product_cache(self):
+        return self._product_cache
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def mirror(self):
+        return self._mirror
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    @property
+    def snapshot(self):
+        """
+        The SnapshotStore delta imports compare against, see snapshot.py.
+        """
+        if self._snapshot is None:
+            self._snapshot = SnapshotStore(self._snapshot_file or None)
+        return self._snapshot
 
-        if not mode:
-            self._mode = config['DEFAULT']['mode']
-        else:
-            self._mode = mode
+    @property
+    def metrics(self):
+        """
+        The Metrics collected for every SXAPI call made by this client, see metrics.py.
+        """
+        return self._metrics
 
-        if not endpoint:
-            self._endpoint = config[self._mode]['endpoint']
-        else:
-            self._endpoint = endpoint
+    @property
+    def tracer(self):
+        return self._tracer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Closes the pooled connections held by this client, and stops the mirror's background refresh.
+        """
+        if self._mirror is not None:
+            self._mirror.stop()
+        self._transport.close()
 
-        if self._debug:
-            self._logfile = config[self._mode]['logfile']
+    def get_directory(self, refresh=False):
+        """
+        Reads the SXAPI functions offered by the endpoint from its WADL. The parsed directory is cached per
+        endpoint (see directory.py and the directory_* settings in config.ini).
+        Input:
+            -refresh, revalidate the cached directory with the server even if it is still fresh
+        Output: A dictionary mapping SXAPI function names to their HTTP method
+        """
+        self._directory = self._directory_cache.load(self._transport, refresh)
+        return self._directory
+
+    def call(self, function, credentials=None, **fields):
+        """
+        Calls any SXAPI function listed in the endpoint's directory.
+        Input:
+            -function, the SXAPI function name, e.g. sxapiicgetproductdatageneralv3
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -fields, the request fields of the call, e.g. productCode='ABC123'
+        Output: The 'response' dictionary of the call. Raises ValueError for functions the endpoint does not offer
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
 
-    def get_directory(self):
-        response = requests.get(self._endpoint+'?_wadl')
-        soup = BeautifulSoup(response.text, 'lxml')
-        for tag in soup.resources.find_all(path=True):
-            self._directory[tag['path'][1:]] = tag.find('method')['name']
+        directory = self._directory
+        if directory is None or function not in directory:
+            directory = self.get_directory()
+        method = directory.get(function)
+        if method is None:
+            raise ValueError('Unknown SXAPI function %s' % function)
+        if method != 'POST':
+            raise ValueError('SXAPI function %s expects %s, only POST calls are supported' % (function, method))
+
+        return self._call(function, self._encoder.request(credentials, **fields))['response']
 
     def create_credentials(self, credentials):
         """
@@ -91,25 +320,112 @@ class py_sxapi:
             'OperatorPassword':credentials['password']}
         return connection_info
 
-    def send_request(self, function, data):
-
-        if self._debug and self._logfile != '': #write to log if debug is turned on
-            with open(self._logfile, 'a') as logf:
+    def send_request(self, function, data, timeout=None):
+        """
+        Posts a request to an SXAPI function over the client's pooled connection, waiting for a slot under the
+        adaptive concurrency limit if there is one.
+        Input:
+            -function, the SXAPI function name, e.g. sxapiicproductmnt
+            -data, the request payload, either a dictionary or JSON bytes from the client's RequestEncoder
+            -timeout, optional (connect, read) tuple overriding the configured timeouts
+        Output: The requests.Response
+        """
+        from requests.exceptions import RequestException, Timeout
+
+        if not isinstance(data, bytes):
+            with self._tracer.span('encode'):
+                data = self._encoder.codec.dumps(data)
+
+        # payloads carry the operator password, so they are only logged when the client was asked to debug
+        debug = self._debug
+        if debug:
+            self._log.debug('%s request: %s', function, JsonText(data), extra={'function': function})
+
+        limiter = self._limiter
+        if limiter is not None:
+            with self._tracer.span('limit_wait'):
+                limiter.acquire()
+        start = time.perf_counter()
+        try:
+            with self._tracer.span('network', request_bytes=len(data)) as span:
+                response = self._transport.post(function, data, timeout=timeout)
+                span.set_attribute('http.status_code', response.status_code)
+        except RequestException as e:
+            seconds = time.perf_counter() - start
+            self._metrics.observe_exception(function, seconds)
+            if limiter is not None:
+                limiter.release(seconds, 'overload' if isinstance(e, Timeout) else 'ignore', function)
+            raise
+        except BaseException:
+            if limiter is not None:
+                limiter.release(time.perf_counter() - start, 'ignore', function)
+            raise
+        seconds = time.perf_counter() - start
+        if limiter is not None:
+            limiter.release(seconds, 'overload' if response.status_code >= 500 else 'ok', function)
+        self._metrics.observe(function, seconds, response.status_code, len(data), len(response.content))
+
+        if response.status_code != 200:
+            self._log.warning('%s returned HTTP %s: %s', function, response.status_code, response.text,
+                              extra={'function': function})
+        elif debug:
+            self._log.debug('%s response: %s', function, response.text, extra={'function': function})
+        return response
 
-                logf.write(json.dumps(data))
-                logf.write('\n')
+    def _decode(self, function, response):
+        """
+        Decodes an SXAPI response, counting it in the metrics if it carries a cErrorMessage.
+        Raises TransientError for an HTTP 5xx or 429 and for a 200 that is not JSON, ValueError for any other
+        response that is not JSON
+        """
+        if response.status_code >= 500 or response.status_code == 429:
+            raise TransientError(function, response.status_code, response.text)
+        try:
+            response_dict = self._encoder.codec.loads(response.content)
+        except ValueError:
+            if response.status_code == 200:
+                raise TransientError(function, response.status_code, response.text)
+            raise ValueError('%s returned HTTP %s: %s' % (function, response.status_code, response.text[:200]))
+        if response_error(response_dict) is not None:
+            self._metrics.observe_error_message(function)
+        return response_dict
+
+    def _call(self, function, data, retry=True):
+        """
+        send_request and _decode, retrying timeouts, connection errors and TransientErrors with jittered
+        exponential backoff while the circuit breaker is closed. Maintenance calls are only retried if they
+        never reached the app server (see retry.py). With retry off the call gets a single attempt.
+        Output: The decoded response
+        """
+        from requests.exceptions import ConnectionError, Timeout
 
-        response = requests.post(self._endpoint+function, json=data)
-        
-        if response.status_code == requests.codes.ok and self._logfile != '':
-            with open(self._logfile, 'a') as logf:
-                print(response.text, file=logf)
-        
-        else:
-            if self._logfile != '':
-                with open(self._logfile, 'a') as logf:
-                    print(response.text, file=logf)
-        return response
+        write = is_write(function)
+        attempt = 0
+        while True:
+            self._breaker.before(function)
+            try:
+                with self._tracer.span(function, attempt=attempt):
+                    response = self.send_request(function=function, data=data)
+                    with self._tracer.span('decode', response_bytes=len(response.content)):
+                        response_dict = self._decode(function, response)
+            except (ConnectionError, Timeout, TransientError) as e:
+                self._breaker.failure()
+                delay = None
+                if retry and (not write or unsent(e)):
+                    delay = self._retry.delay(attempt)
+                if delay is None:
+                    raise
+                self._log.warning('%s failed, retrying in %.2fs: %s', function, delay, e,
+                                  extra={'function': function})
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                # the app server answered, so it is up
+                self._breaker.success()
+                raise
+            self._breaker.success()
+            return response_dict
 
     def check_product(self, product, credentials=None):
         """
@@ -126,25 +442,40 @@ class py_sxapi:
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        request = {'request':
-            {
-                'companyNumber': credentials['cono'],
-                'operatorInit' : credentials['username'],
-                'operatorPassword' : credentials['password'],
-                'productCode' : product
-            }
-        }
+        request = self._encoder.request(credentials, productCode=product)
+
+        response_dict = self._call('sxapiicgetproductlistv2', request)
 
-        response = self.send_request(function='sxapiicgetproductlistv2', data=request)
+        return product_listed(product, response_dict)
 
-        response_dict = response.json()
+    def list_products(self, prefix='', warehouse='', limit=5000, credentials=None):
+        """
+        Lists product codes in bulk. Uses the sxapiicgetproductlistv2 Call, whose productCode is matched as a
+        prefix
+        Input:
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -prefix, the start of the product codes to list. '' lists every product
+            -warehouse, only list products set up in this warehouse (ICSW). '' lists ICSP
+            -limit, the max number of products returned
+        Output: A tuple of the list of product codes and whether there were more than limit of them
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
 
-        l = response_dict['response']['tProdv2']['t-prodv2']
-        items = [item['prod'] for item in l]
+        fields = {'productCode': prefix, 'recordLimit': limit}
+        if warehouse != '':
+            fields['whse'] = warehouse
+        request = self._encoder.request(credentials, **fields)
 
-        if product in items:
-            return True
-        return False
+        response_dict = self._call('sxapiicgetproductlistv2', request)['response']
+        products = [item['prod'] for item in response_dict['tProdv2']['t-prodv2']]
+        if 'moreRecords' in response_dict:
+            return products, bool(response_dict['moreRecords'])
+        return products, len(products) >= limit
 
     def check_product_warehouse(self, product, warehouse, credentials=None):
         """
@@ -162,27 +493,11 @@ class py_sxapi:
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        request={'request':
-            {
-                'companyNumber': credentials['cono'],
-                'operatorInit': credentials['username'],
-                'operatorPassword': credentials['password'],
-                'product': product,
-                'whse': warehouse
-            }
-        }
-
-        response = self.send_request(function='sxapiicgetwhseproductdatageneralv2', data=request)
-
-        response_dict = response.json()
-
-        if response_dict['response']['cErrorMessage'] == \
-                'Product/Warehouse Not Set Up in Warehouse Products - ICSW (4602)':
-            return False
-        elif response_dict['response']['cErrorMessage'] != '':
-            raise ValueError('Cannot validate ICSW record')
-        else:
-            return True
+        request = self._encoder.request(credentials, product=product, whse=warehouse)
+
+        response_dict = self._call('sxapiicgetwhseproductdatageneralv2', request)
+
+        return warehouse_product_exists(response_dict)
 
     def get_product_data(self, product, use_xref=0, credentials=None):
         """
@@ -196,29 +511,145 @@ class py_sxapi:
             -product: the product number
             -use_xref: whether or not to use the cross-reference logic. Defaults to 0 (no)
         Output:
-            a dictionary of product information, passed through from the sxapi call
+            a dictionary of product information, passed through from the sxapi call. Served from the product
+            cache if there is one, or shared with an identical call already in flight
+
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        key = ProductDataCache.key(credentials['cono'], product, use_xref)
+        if self._product_cache is not None:
+            cached = self._product_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+
+        def fetch():
+            request = self._encoder.request(credentials, productCode=product, useCrossReferenceFlag=use_xref)
+
+            response_dict = self._call('sxapiicgetproductdatageneralv3', request)
+
+            if self._product_cache is not None and not response_dict['response'].get('cErrorMessage'):
+                self._product_cache.set(key, response_dict['response'])
+            return response_dict['response']
+
+        return dict(self._product_flight.do(key, fetch))
 
+    def get_product_data_many(self, products, use_xref=0, credentials=None, workers=None):
+        """
+        Returns basic data about several products, looking each distinct product up once, concurrently. Uses
+        get_product_data
+        Input:
+            -credentials, a dictionary containing three items, which are used in
+                creating the connection:
+                    -cono: the SXe Company Number in the callConnection object
+                    -username: the initials of the SXe operator making the call
+                    -password: the password of the SXe operating making the call
+            -products: an iterable of product numbers
+            -use_xref: whether or not to use the cross-reference logic. Defaults to 0 (no)
+            -workers, the max number of concurrent calls. Defaults to the product_workers setting in config.ini
+        Output:
+            a dictionary mapping each product to its dictionary of product information
         """
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
+        workers = self._pool_size(workers, self._product_workers)
+
+        products = list(dict.fromkeys(products))
+
+        def lookup(product):
+            return self.get_product_data(product, use_xref, credentials)
 
-        request = {'request':
-            {
-                'companyNumber': credentials['cono'],
-                'operatorInit': credentials['username'],
-                'operatorPassword': credentials['password'],
-                'productCode': product,
-                'useCrossReferenceFlag': use_xref
-            }
-        }
+        if workers <= 1 or len(products) <= 1:
+            return dict(zip(products, map(lookup, products)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(products, pool.map(self._tracer.wrap(lookup), products)))
 
-        response = self.send_request(function='sxapiicgetproductdatageneralv3', data=request)
+    def seed_snapshot(self, products, credentials=None, workers=None):
+        """
+        Fills the delta import snapshot with the current SX.e values of products, so the first delta
+        item_import after it already skips unchanged fields. Uses get_product_data_many
+        Input:
+            -products, an iterable of product numbers
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -workers, the max number of concurrent calls. Defaults to the workers setting in config.ini
+        Output: The number of products stored. Only the ICSP fields that sxapiICProductGetDataGeneralV3
+        returns under the same (lowercased) name as in sxapiICProductMnt can ever be skipped
+        """
+        seeded = 0
+        for product, response in self.get_product_data_many(products, credentials=credentials,
+                                                            workers=workers).items():
+            if response.get('cErrorMessage'):
+                continue
+            fields = {name.lower(): value for name, value in response.items()
+                      if name != 'cErrorMessage' and isinstance(value, (str, int, float))}
+            self.snapshot.put('sxapiicproductmnt', product, '', fields)
+            seeded += 1
+        return seeded
+
+    def _pool_size(self, requested, configured):
+        if requested is not None:
+            return requested
+        if self._limiter is not None:
+            return max(configured, self._limiter.max_limit)
+        return configured
+
+    def resolve_update_modes(self, keys, credentials=None, workers=None):
+        """
+        Determines whether each product (or product/warehouse) needs to be added or changed. Duplicate keys are
+        only checked once. With a mirror (see mirror.py), keys it has seen recently are 'chg' without a call,
+        and only the rest are checked live, spread across a thread pool.
+        Input:
+            -keys, an iterable of (prod, whse) tuples. whse is '' for ICSP-only rows
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -workers, the max number of concurrent existence checks. Defaults to the workers setting in config.ini
+        Output: A dictionary mapping each (prod, whse) tuple to 'add' or 'chg'.
+            Raises the same ValueError as check_product_warehouse for unexpected ICSW errors
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+        workers = self._pool_size(workers, self._workers)
+
+        with self._tracer.span('resolve_update_modes') as span:
+            modes = self._resolve_update_modes(list(dict.fromkeys(keys)), credentials, workers)
+            span.set_attribute('keys', len(modes))
+        return modes
+
+    def _resolve_update_modes(self, keys, credentials, workers):
+        modes = {}
+        if self._mirror is not None:
+            self._mirror.load(credentials)
+            modes = dict.fromkeys(self._mirror.known(keys), 'chg')
+            keys = [key for key in keys if key not in modes]
+
+        def check(key):
+            prod, whse = key
+            if whse != '':
+                found = self.check_product_warehouse(prod, whse, credentials)
+            else:
+                found = self.check_product(prod, credentials)
+            if found and self._mirror is not None:
+                self._mirror.add(prod, whse)
+            return 'chg' if found else 'add'
 
-        response_dict = response.json()
+        if workers <= 1 or len(keys) <= 1:
+            checked = [check(key) for key in keys]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                checked = list(pool.map(self._tracer.wrap(check), keys))
 
-        return response_dict['response']
+        modes.update(zip(keys, checked))
+        return modes
 
-    def item_import(self, file, credentials=None):
+    def item_import(self, file, credentials=None, workers=None, inflight=None, shards=None, delta=None):
         """
         Import items based on file input. Uses the sxapiICProductMnt Call.
         Input:
@@ -229,79 +660,318 @@ class py_sxapi:
                 -password: the password of the SXe operating making the call 
             -file, an iterable containing a table mapping to the data needed 
             for sxapiICProductMnt
-        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+            Or a columnar table (see columnar.py): a pandas DataFrame, pyarrow Table, Parquet file or dict of columns
+            -workers, the max number of concurrent add/chg existence checks. Defaults to the workers
+            setting in config.ini
+            -inflight, the max number of maintenance batches out at once. Defaults to the inflight_batches
+            setting in config.ini
+            -shards, the number of worker processes the rows are split over by product. Defaults to the
+            shards setting in config.ini. See sharding.py
+            -delta, only send the fields whose value differs from the snapshot of the last values applied.
+            Defaults to the delta setting in config.ini. See snapshot.py
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData. With a journal, rows
+        already applied by an earlier run of the same file are skipped and their results included
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+
+        with self._tracer.span('item_import'):
+            run, journaled, results = self._plan_import('sxapiicproductmnt', file, credentials, workers, inflight,
+                                                        shards, delta)
+
+            return_dict = {'ErrorMessage': [], 'ReturnData': []}
+
+            for errors, return_data in chain(journaled, results):
+                if errors is not None:
+                    return_dict['ErrorMessage'].extend(errors)
+                if return_data is not None:
+                    return_dict['ReturnData'].extend(return_data)
+
+                self._log.info('ICProductMnt - %s', JsonText({'ErrorMessage': errors, 'ReturnData': return_data}))
+
+            self._finish(run)
+
+            return json.dumps(return_dict)
+
+    def item_import_stream(self, file, credentials=None, batch_size=None, window=1000, workers=None, inflight=None,
+                           delta=None):
+        """
+        Streaming version of item_import. Rows are read window rows at a time, their add/chg modes are resolved,
+        and each sxapiICProductMnt batch is sent as soon as it fills, so memory use depends on window and
+        batch_size rather than on the size of file.
+        Input:
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -file, an iterable containing a table mapping to the data needed
+            for sxapiICProductMnt. It is only read as far as the batches consumed so far need
+            -batch_size, a fixed number of field changes to send per call. Defaults to the adaptive batch size
+            (see the batch_* settings in config.ini)
+            -window, the number of rows whose existence checks are resolved together
+            -workers, the max number of concurrent add/chg existence checks. Defaults to the workers
+            setting in config.ini
+            -inflight, the max number of maintenance batches out at once. Defaults to the inflight_batches
+            setting in config.ini
+            -delta, only send the fields whose value differs from the snapshot of the last values applied.
+            Defaults to the delta setting in config.ini. See snapshot.py
+        Output: Generator yielding a dictionary with the ErrorMessage and ReturnData lists of each batch
+        as it completes
         """
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        chg_list = []
+        if delta is None:
+            delta = self._delta
+        batcher = None
+        if batch_size is not None:
+            batcher = AdaptiveBatcher.fixed(batch_size)
+
+        changes = self._stream_item_changes(file, credentials, window, workers)
+        for errors, return_data in self._submit_batches('sxapiicproductmnt', changes, credentials, batcher,
+                                                        inflight, delta=delta):
+            batch_dict = {'ErrorMessage': errors or [], 'ReturnData': return_data or []}
+
+            self._log.info('ICProductMnt - %s', JsonText(batch_dict))
 
+            yield batch_dict
+
+    def _stream_item_changes(self, file, credentials, window, workers):
         set_no = 1
-        for row in file:
-            seq_no = 1
-            key1 = row['prod']
-            if 'whse' in row:
-                key2 = row['whse']
-            else:
-                key2 = ''
-            update_mode = 'chg'
-            
-            if key2 != '':
-                if self.check_product_warehouse(key1, key2, credentials):
-                    update_mode = 'chg'
-                else:
-                    update_mode = 'add'
+        for rows in ichunk(window, file):
+            update_modes = self.resolve_update_modes([item_keys(row) for row in rows], credentials, workers)
+            yield from iter_item_changes(rows, update_modes, set_no)
+            set_no += len(rows)
+
+    def _plan_import(self, function, file, credentials, workers=None, inflight=None, shards=None, delta=None):
+        """
+        Works out what a maintenance import still has to send: looks it up in the journal, resolves add/chg
+        modes for sxapiicproductmnt, and builds the change records, from rows or from a columnar table
+        (see columnar.py). Tables imported over several shards are handed to the shards as rows.
+        Output: A tuple of (run fingerprint, journaled (errors, return_data) results, generator of the
+        (errors, return_data) results of the batches sent now)
+        """
+        if shards is None:
+            shards = self._shards
+        if delta is None:
+            delta = self._delta
+
+        with self._tracer.span('read_input'):
+            table = as_columns(file)
+            if table is not None and shards > 1:
+                file, table = table.rows(), None
+            if table is not None:
+                run, done, journaled = self._resume(function, table.records())
             else:
-                if self.check_product(key1, credentials):
-                    update_mode = 'chg'
-                else:
-                    update_mode = 'add'
-
-            for key in row.keys():
-                if key not in ['prod','whse']:
-                    tmp_dict = {'fieldName': key.lower(), 'fieldValue': row[key], 'key1': key1, 'key2': key2,
-                                'seqNo': seq_no, 'setNo': set_no, 'updateMode': update_mode}
-                    chg_list.append(tmp_dict)
-                    seq_no += 1
-            
-            set_no += 1
-
-        chg_batch = list(chunk(100, chg_list))
-
-        return_dict = {'ErrorMessage': [], 'ReturnData': []}
-
-        for batch in chg_batch:
-            #the request payload. See ICProductMnt in the SXAPI docs for more information on structure
-            request={'request':
-                {
-                    'companyNumber': credentials['cono'],
-                    'operatorInit' : credentials['username'],
-                    'operatorPassword' : credentials['password'],
-                    'tMntTt' : {'t-mnt-tt':batch}
-                }
-            }
-        
-            response = self.send_request(function='sxapiicproductmnt', data=request)
-
-            response_dict = response.json()
-
-            if response_dict['response']['cErrorMessage'] is not None:
-                errors = response_dict['response']['cErrorMessage'].split('|')
-                for item in errors:
-                    return_dict['ErrorMessage'].append(item)
-
-            if response_dict['response']['returnData'] is not None:
-                return_data = response_dict['response']['returnData'].split('|')
-                for item in return_data:
-                    return_dict['ReturnData'].append(item)
-
-            if self._logfile != '':
-                with open(self._logfile, 'a') as logf:
-                    print("%s: ICProductMnt - %s" % (datetime.datetime.utcnow(), json.dumps(return_dict)), file=logf)
-
-        return json.dumps(return_dict)
-
-    def customer_import(self, file, credentials=None):
+                rows = list(file)
+                run, done, journaled = self._resume(function, rows)
+
+        if table is not None:
+            update_modes = None
+            if function == 'sxapiicproductmnt':
+                keys = [key for set_no, key in enumerate(table.keys(function), 1) if set_no not in done]
+                update_modes = self.resolve_update_modes(keys, credentials, workers)
+            changes = table.changes(function, update_modes, done)
+            return run, journaled, self._submit_batches(function, changes, credentials, inflight=inflight, run=run,
+                                                        delta=delta)
+
+        if shards > 1:
+            return run, journaled, self._submit_shards(function, rows, done, credentials, shards, workers, inflight,
+                                                       run, delta)
+        if done:
+            pending = [(set_no, row) for set_no, row in enumerate(rows, 1) if set_no not in done]
+            changes = self._numbered_changes(function, pending, credentials, workers)
+        elif function == 'sxapiicproductmnt':
+            update_modes = self.resolve_update_modes([item_keys(row) for row in rows], credentials, workers)
+            with self._tracer.span('build_changes'):
+                changes = item_changes(rows, update_modes)
+        elif function == 'sxapiarcustomermnt':
+            with self._tracer.span('build_changes'):
+                changes = customer_changes(rows)
+        else:
+            with self._tracer.span('build_changes'):
+                changes = pricing_changes(rows)
+        return run, journaled, self._submit_batches(function, changes, credentials, inflight=inflight, run=run,
+                                                    delta=delta)
+
+    def _resume(self, function, rows):
+        """
+        Looks an import up in the journal.
+        Output: A tuple of (run fingerprint, set numbers already applied, their (errors, return_data) results).
+        The fingerprint is None when the client has no journal
+        """
+        if self._journal is None:
+            return None, set(), []
+        run = ImportJournal.fingerprint(function, rows)
+        done, journaled = self._journal.completed(run)
+        if done:
+            self._log.info('%s - resuming, %d sets already applied', function, len(done))
+        return run, done, journaled
+
+    def _finish(self, run):
+        if run is not None:
+            pending = self._journal.finish(run)
+            if pending:
+                self._log.warning('%d sets may not have been applied and are kept in the journal, run the import '
+                                  'again to send them: %s', len(pending), pending)
+
+    def _numbered_changes(self, function, numbered_rows, credentials, workers=None):
+        """
+        Builds the change records of (set_no, row) tuples for a maintenance function, keeping each row's set number.
+        For sxapiicproductmnt the add/chg modes of the rows are resolved first.
+        """
+        if function == 'sxapiicproductmnt':
+            update_modes = self.resolve_update_modes([item_keys(row) for _, row in numbered_rows], credentials,
+                                                     workers)
+            return numbered_changes(lambda rows: iter_item_changes(rows, update_modes), numbered_rows)
+        if function == 'sxapiarcustomermnt':
+            return numbered_changes(customer_changes, numbered_rows)
+        return numbered_changes(pricing_changes, numbered_rows)
+
+    def _submit_shards(self, function, rows, done, credentials, shards, workers=None, inflight=None, run=None,
+                       delta=False):
+        """
+        Splits rows over shards worker processes by key1 (see sharding.py), each importing its rows with its own
+        client, HTTP pool and batchers. With an adaptive limiter, each shard gets an even share of its limits, so
+        the shards together stay within them; workers and inflight are per shard. The shards' call metrics are
+        merged into this client's. Delta imports share the snapshot only if it is kept in a file. With a mirror,
+        each shard is handed the keys of its rows the mirror knows, rather than loading a mirror of its own.
+        Output: Generator of a single (errors, return_data) tuple, the messages of all shards merged in set order
+        """
+        # loads multiprocessing, which only the shards need
+        from concurrent.futures import ProcessPoolExecutor
+
+        settings = (self._mode, self._endpoint, self._logfile, self._debug)
+        journal_path = self._journal.path if run is not None else None
+        snapshot_path = self.snapshot.path if delta else None
+
+        split = [numbered_rows for numbered_rows in shard_rows(function, rows, shards, done) if numbered_rows]
+        if not split:
+            return
+        known = [None] * len(split)
+        if self._mirror is not None and function == 'sxapiicproductmnt':
+            self._mirror.load(credentials)
+            known = [list(self._mirror.known([item_keys(row) for _, row in numbered_rows]))
+                     for numbered_rows in split]
+        limiter = self._limiter.share(len(split)) if self._limiter is not None else None
+        results = []
+        with ProcessPoolExecutor(max_workers=len(split)) as pool:
+            futures = [pool.submit(import_shard, settings, function, numbered_rows, credentials, workers, inflight,
+                                   journal_path, run, snapshot_path, delta, known_keys, limiter)
+                       for numbered_rows, known_keys in zip(split, known)]
+            for future in futures:
+                shard_results, metrics = future.result()
+                self._metrics.merge(metrics)
+                results.extend(shard_results)
+        yield merge_results(results)
+
+    def _submit_batches(self, function, changes, credentials, batcher=None, inflight=None, run=None, delta=False,
+                        numbered=False):
+        """
+        Sends change records to a maintenance call in whole-set batches, feeding each call's latency and
+        payload size back into the batcher. Up to inflight batches are out at once; the next batches are
+        built and sent while earlier ones are still waiting on the app server. With a run fingerprint, each
+        acknowledged batch is recorded in the journal. In delta mode, unchanged fields are dropped first and
+        the snapshot is updated from each batch that comes back without errors.
+        Output: Generator of (errors, return_data) tuples, one per batch, in submission order. With numbered, of
+        (first set number, errors, return_data) tuples
+        """
+        if batcher is None:
+            batcher = self._batchers[function]
+        inflight = self._pool_size(inflight, self._inflight)
+        if delta:
+            changes = self._delta_changes(function, changes)
+
+        if inflight <= 1:
+            for batch in batcher.batches(changes):
+                yield self._send_batch(function, batch, credentials, batcher, run, delta, numbered)
+            return
+
+        pending = deque()
+        send_batch = self._tracer.wrap(self._send_batch)
+        with ThreadPoolExecutor(max_workers=inflight) as pool:
+            try:
+                for batch in batcher.batches(changes):
+                    if len(pending) == inflight:
+                        yield pending.popleft().result()
+                    pending.append(pool.submit(send_batch, function, batch, credentials, batcher, run, delta,
+                                               numbered))
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _delta_changes(self, function, changes):
+        snapshot = self.snapshot
+        seen, sent = snapshot.fields_seen, snapshot.fields_sent
+        yield from snapshot.changed(function, changes)
+        self._log.info('%s - delta, sending %d of %d field changes', function, snapshot.fields_sent - sent,
+                       snapshot.fields_seen - seen)
+
+    def _send_batch(self, function, batch, credentials, batcher, run=None, delta=False, numbered=False):
+        with self._tracer.span('batch', records=len(batch)):
+            errors, return_data = self._apply_batch(function, batch, credentials, batcher, run=run)
+            if delta and not errors:
+                self.snapshot.update(function, batch)
+        if numbered:
+            return batch[0]['setNo'], errors, return_data
+        return errors, return_data
+
+    def _apply_batch(self, function, batch, credentials, batcher, retry=True, run=None):
+        """
+        Sends one maintenance batch. If it is rejected as a whole, with a cErrorMessage and no returnData, it is
+        split along set boundaries and the halves are sent on their own, down to single sets, so only the sets
+        at fault fail. A batch that timed out or came back with an HTTP 5xx may have been applied, so it is not
+        sent again: each of its sets is reported as failed. With bisect_batches off these failures are raised.
+        With a run fingerprint, each batch or half that got an answer is recorded in the journal, and the sets
+        of one that did not are recorded as pending, to be sent again when the import is rerun.
+        Output: A tuple of (errors, return_data) for the whole batch
+        """
+        from requests.exceptions import Timeout
+
+        with self._tracer.span('encode'):
+            request = self._encoder.mnt_request(credentials, batch)
+
+        start = time.perf_counter()
+        try:
+            errors, return_data = mnt_results(self._call(function, request, retry))
+        except (Timeout, TransientError) as e:
+            batcher.failed()
+            if isinstance(e, CircuitOpenError) or not self._bisect:
+                raise
+            sets = set_numbers(batch)
+            self._log.warning('%s - sets %s to %s failed and were not resent, as they may have been applied: %s',
+                              function, sets[0], sets[-1], e, extra={'function': function})
+            if run is not None:
+                self._journal.record_pending(run, sets)
+            return unapplied(sets, e), None
+        batcher.record(len(batch), time.perf_counter() - start, len(request))
+
+        if errors and not return_data and self._bisect:
+            halves = split_sets(batch)
+            if halves is not None:
+                return self._bisect_batch(function, halves, credentials, batcher, errors[0], run)
+        if run is not None:
+            self._journal.record(run, batch, errors, return_data)
+        return errors, return_data
+
+    def _bisect_batch(self, function, halves, credentials, batcher, reason, run=None):
+        sets = set_numbers(halves[0]) + set_numbers(halves[1])
+        self._log.warning('%s - batch of sets %s to %s failed, splitting it: %s', function, sets[0], sets[-1], reason,
+                          extra={'function': function})
+        errors, return_data = None, None
+        for half in halves:
+            half_errors, half_return_data = self._apply_batch(function, half, credentials, batcher, retry=False,
+                                                              run=run)
+            if half_errors is not None:
+                errors = (errors or []) + half_errors
+            if half_return_data is not None:
+                return_data = (return_data or []) + half_return_data
+        return errors, return_data
+
+    def customer_import(self, file, credentials=None, inflight=None, shards=None, delta=None):
         """
         Import customer data based on file input. Uses the sxapiARCustomerMnt Call.
         Input:
@@ -312,59 +982,38 @@ class py_sxapi:
                 -password: the password of the SXe operating making the call 
             -file, an iterable containing a table mapping to the data needed 
             for sxapiARCustomerMnt
-        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+            Or a columnar table (see columnar.py): a pandas DataFrame, pyarrow Table, Parquet file or dict of columns
+            -inflight, the max number of maintenance batches out at once. Defaults to the inflight_batches
+            setting in config.ini
+            -shards, the number of worker processes the rows are split over by customer number. Defaults to the
+            shards setting in config.ini. See sharding.py
+            -delta, only send the fields whose value differs from the snapshot of the last values applied.
+            Defaults to the delta setting in config.ini. See snapshot.py
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData, gathered over all batches
+            (and over the batches an earlier, interrupted run of the same file applied, when journaled)
         """
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        chg_list = []
+        with self._tracer.span('customer_import'):
+            run, journaled, results = self._plan_import('sxapiarcustomermnt', file, credentials, inflight=inflight,
+                                                        shards=shards, delta=delta)
 
-        set_no = 1
-        for row in file:
-            seq_no = 1
-            key1 = row['custno']
-            if 'shipto' in row:
-                key2 = row['shipto']
-            else:
-                key2 = ''
-            for key in row.keys():
-                if key not in ['custno','shipto']:
-                    tmp_dict = {'fieldName': key.lower(), 'fieldValue': row[key], 'key1': key1, 'key2': key2,
-                                'seqNo': seq_no, 'setNo': set_no, 'updateMode': 'chg'}
-                    chg_list.append(tmp_dict)
-                    seq_no += 1
-            
-            set_no += 1
-
-        request={'request':  #the request payload. See ICProductMnt in the SXAPI docs for more information on structure
-            {
-                'companyNumber': credentials['cono'],
-                'operatorInit' : credentials['username'],
-                'operatorPassword' : credentials['password'],
-                'tMntTt' : {'t-mnt-tt':chg_list}
-            }
-        }
-        
-        response = self.send_request(function='sxapiarcustomermnt', data=request)
-
-        response_dict = response.json()
-        return_dict = {}
-
-        if response_dict['response']['cErrorMessage'] is not None:
-            errors = response_dict['response']['cErrorMessage'].split('|')
-            return_dict['ErrorMessage'] = errors
-
-        if response_dict['response']['returnData'] is not None:
-            return_data = response_dict['response']['returnData'].split('|')
-            return_dict['ReturnData'] = return_data
-
-        if self._logfile != '':
-            with open(self._logfile, 'a') as logf:
-                print("%s: ARCustomerMnt - %s" % (datetime.datetime.utcnow(), json.dumps(return_dict)), file=logf)
-
-        return json.dumps(return_dict)
-
-    def pricing_import(self, file, credentials=None):
+            return_dict = {}
+
+            for errors, return_data in chain(journaled, results):
+                if errors is not None:
+                    return_dict.setdefault('ErrorMessage', []).extend(errors)
+                if return_data is not None:
+                    return_dict.setdefault('ReturnData', []).extend(return_data)
+
+            self._finish(run)
+
+            self._log.info('ARCustomerMnt - %s', JsonText(return_dict))
+
+            return json.dumps(return_dict)
+
+    def pricing_import(self, file, credentials=None, inflight=None, shards=None, delta=None):
         """
         Import customer data based on file input. Uses the sxapiARCustomerMnt Call.
         Input:
@@ -375,62 +1024,36 @@ class py_sxapi:
                 -password: the password of the SXe operating making the call
             -file, an iterable containing a table mapping to the data needed
             for sxapiARCustomerMnt
-        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData
+            Or a columnar table (see columnar.py): a pandas DataFrame, pyarrow Table, Parquet file or dict of columns
+            -inflight, the max number of maintenance batches out at once. Defaults to the inflight_batches
+            setting in config.ini
+            -shards, the number of worker processes the rows are split over by pdrecno. Defaults to the
+            shards setting in config.ini. See sharding.py
+            -delta, only send the fields whose value differs from the snapshot of the last values applied.
+            Defaults to the delta setting in config.ini. See snapshot.py
+        Output: A JSON array consisting of two lists: ErrorMessage and ReturnData, gathered over all batches
+            (and over the batches an earlier, interrupted run of the same file applied, when journaled)
         """
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        chg_list = []
+        with self._tracer.span('pricing_import'):
+            run, journaled, results = self._plan_import('sxapipdpricingmnt', file, credentials, inflight=inflight,
+                                                        shards=shards, delta=delta)
 
-        set_no = 1
-        for row in file:
-            update_mode = 'chg'
-            seq_no = 1
-            if 'pdrecno' in row.keys():
-                key1 = row['pdrecno']
-                if row['pdrecno'] == '':
-                    update_mode = 'add'
-            else:
-                key1 = ''
-                update_mode = 'add'
-            key2 = ''
-            for key in row.keys():
-                if key not in ['pdrecno']:
-                    tmp_dict = {'fieldName': key.lower(), 'fieldValue': row[key], 'key1': key1, 'key2': key2,
-                                'seqNo': seq_no, 'setNo': set_no, 'updateMode': update_mode}
-                    chg_list.append(tmp_dict)
-                    seq_no += 1
-
-            set_no += 1
-
-        request = {
-            'request':  # the request payload. See ICProductMnt in the SXAPI docs for more information on structure
-                {
-                    'companyNumber': credentials['cono'],
-                    'operatorInit': credentials['username'],
-                    'operatorPassword': credentials['password'],
-                    'tMntTt': {'t-mnt-tt': chg_list}
-                }
-        }
-
-        response = self.send_request(function='sxapipdpricingmnt', data=request)
-
-        response_dict = response.json()
-        return_dict = {}
-
-        if response_dict['response']['cErrorMessage'] is not None:
-            errors = response_dict['response']['cErrorMessage'].split('|')
-            return_dict['ErrorMessage'] = errors
-
-        if response_dict['response']['returnData'] is not None:
-            return_data = response_dict['response']['returnData'].split('|')
-            return_dict['ReturnData'] = return_data
-
-        if self._logfile != '':
-            with open(self._logfile, 'a') as logf:
-                print("%s: ARCustomerMnt - %s" % (datetime.datetime.utcnow(), json.dumps(return_dict)), file=logf)
-
-        return json.dumps(return_dict)
+            return_dict = {}
+
+            for errors, return_data in chain(journaled, results):
+                if errors is not None:
+                    return_dict.setdefault('ErrorMessage', []).extend(errors)
+                if return_data is not None:
+                    return_dict.setdefault('ReturnData', []).extend(return_data)
+
+            self._finish(run)
+
+            self._log.info('PDPricingMnt - %s', JsonText(return_dict))
+
+            return json.dumps(return_dict)
 
     def get_pricing(self, data, customer_number, ship_to, warehouse, credentials=None):
         """
@@ -448,50 +1071,37 @@ class py_sxapi:
         if credentials is None and self._credentials != {}:
             credentials = self._credentials
 
-        if customer_number == 0:
-            customer_number = '10008088'
-        if ship_to == '0':
-            ship_to = '1'
-        if warehouse == '':
-            warehouse = '100p'
+        customer_number, ship_to, warehouse = pricing_defaults(customer_number, ship_to, warehouse)
 
         return_dict: List[Dict[str, Any]] = []
 
-        for row in data:
-            try:
-                unit = row['unit']
-            except KeyError:
-                unit = 'each'
-
-            try:
-                qty = row['qty']
-            except KeyError:
-                qty = 1
-
-            request = {
-                'request':  # request payload. See ICProductMnt in the SXAPI docs for more information on structure
-                    {
-                        'companyNumber': credentials['cono'],
-                        'operatorInit': credentials['username'],
-                        'operatorPassword': credentials['password'],
-                        'customerNumber': customer_number,
-                        'shipTo': ship_to,
-                        'warehouse': warehouse,
-                        'quantity': qty,
-                        'productCode': row['prod'],
-                        'unitOfMeasure': unit
-                    }
-            }
-
-            response = self.send_request(function='sxapioepricing', data=request)
-            response_dict = response.json()
-
-            return_dict.append({'prod': row['prod'],
-                                'price': response_dict['response']['price'],
-                                'discount_amount':response_dict['response']['discountAmount'],
-                                'discount_type':response_dict['response']['discountType'],
-                                'net_available':response_dict['response']['netAvailable']
-                                })
+        with self._tracer.span('get_pricing') as span:
+            cache_hits = 0
+            for row in data:
+                product, unit, qty = pricing_item(row)
+
+                if self._pricing_cache is not None:
+                    cache_key = PricingCache.key(credentials['cono'], customer_number, ship_to, warehouse, product,
+                                                 unit, qty)
+                    cached = self._pricing_cache.get(cache_key)
+                    if cached is not None:
+                        return_dict.append(dict(cached))
+                        cache_hits += 1
+                        continue
+
+                with self._tracer.span('encode'):
+                    request = self._encoder.request(credentials, **pricing_fields(customer_number, ship_to, warehouse,
+                                                                                  product, unit, qty))
+
+                response_dict = self._call('sxapioepricing', request)
+
+                priced = pricing_row(product, response_dict)
+                # a cErrorMessage, e.g. an unknown customer, is not cached: the cause may be fixed before it expires
+                if self._pricing_cache is not None and response_error(response_dict) is None:
+                    self._pricing_cache.set(cache_key, dict(priced))
+                return_dict.append(priced)
+            span.set_attribute('rows', len(return_dict))
+            span.set_attribute('cache_hits', cache_hits)
 
         """with open('//pssfile3/Users/dbriggs/My Documents/Pricing/pricing_test_out.csv', 'w') as csvfile:
             fieldnames = ['prod', 'price']
@@ -504,3 +1114,98 @@ class py_sxapi:
             return return_dict[0]
         else:
             return return_dict
+
+    def get_pricing_matrix(self, customers, products, quantities=(1,), warehouse='', credentials=None, workers=None,
+                           output=None):
+        """
+        Prices every customer x product x quantity break combination at one warehouse. Uses the sxapiOEPricing
+        Call. Duplicate cells are priced once, and the calls are spread across a thread pool. See matrix.py.
+        Input:
+            -customers, customer numbers, or (customer number, ship to) tuples
+            -products, product codes, or dictionaries with a prod and an optional unit column (default 'each')
+            -quantities, the quantity breaks to price each product at
+            -warehouse, the warehouse to price at
+            -credentials, a dictionary containing three items, which are used in
+            creating the connection:
+                -cono: the SXe Company Number in the callConnection object
+                -username: the initials of the SXe operator making the call
+                -password: the password of the SXe operating making the call
+            -workers, the max number of concurrent pricing calls. Defaults to the pricing_workers setting in
+            config.ini
+            -output, an optional CSV or Parquet file the rows are streamed to as they are priced
+        Output: A Columns table (see columnar.py) with the MATRIX_COLUMNS of matrix.py and one row per distinct
+        cell, in grid order. Cells that could not be priced have empty price columns and the reason in error
+        """
+        if credentials is None and self._credentials != {}:
+            credentials = self._credentials
+        workers = self._pool_size(workers, self._pricing_workers)
+
+        warehouse = pricing_defaults('', '', warehouse)[2]
+        cells = pricing_grid(customers, products, quantities)
+
+        def price(cell):
+            customer_number, ship_to, product, unit, qty = cell
+            if self._pricing_cache is not None:
+                cache_key = PricingCache.key(credentials['cono'], customer_number, ship_to, warehouse, product, unit,
+                                             qty)
+                cached = self._pricing_cache.get(cache_key)
+                if cached is not None:
+                    return matrix_row(cell, warehouse, cached)
+
+            with self._tracer.span('encode'):
+                request = self._encoder.request(credentials, **pricing_fields(customer_number, ship_to, warehouse,
+                                                                              product, unit, qty))
+            try:
+                response_dict = self._call('sxapioepricing', request)
+                error = response_error(response_dict)
+                if error is not None:
+                    return matrix_row(cell, warehouse, None, error)
+                priced = pricing_row(product, response_dict)
+            except Exception as e:
+                # the cell gets its row either way, so one bad call does not lose the rest of the grid
+                return matrix_row(cell, warehouse, None, str(e) or type(e).__name__)
+
+            if self._pricing_cache is not None:
+                self._pricing_cache.set(cache_key, dict(priced))
+            return matrix_row(cell, warehouse, priced)
+
+        writer = MatrixWriter(output) if output is not None else None
+        rows = []
+        try:
+            with self._tracer.span('get_pricing_matrix', cells=len(cells)):
+                for row in self._map_ordered(price, cells, workers):
+                    rows.append(row)
+                    if writer is not None:
+                        writer.write(row)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        errors = sum(1 for row in rows if row[-1])
+        self._log.info('OEPricing matrix - %d cells priced, %d failed', len(rows) - errors, errors)
+
+        return Columns(MATRIX_COLUMNS, zip(*rows)) if rows else Columns(MATRIX_COLUMNS, [[]] * len(MATRIX_COLUMNS))
+
+    def _map_ordered(self, fn, items, workers):
+        """
+        Like ThreadPoolExecutor.map, but with no more than workers * 4 calls queued ahead of the results
+        consumed, so a large grid is not all submitted up front.
+        Output: Generator of the results of fn, in the order of items
+        """
+        if workers <= 1:
+            yield from map(fn, items)
+            return
+
+        fn = self._tracer.wrap(fn)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for item in items:
+                    if len(pending) >= workers * 4:
+                        yield pending.popleft().result()
+                    pending.append(pool.submit(fn, item))
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,146 @@
+"""
+    Retries and circuit breaking for transient SXAPI failures.
+
+    A call is retried when it times out, cannot connect, comes back with an HTTP 5xx or 429, or comes
+    back with a body that is not JSON, such as the app server's HTML error page. The waits between
+    attempts grow exponentially with full jitter, so clients that failed together do not retry together.
+    The CircuitBreaker opens after threshold failures in a row: calls then fail at once with
+    CircuitOpenError rather than piling onto an app server that is down, until a single probe call is
+    let through after reset_timeout seconds and succeeds.
+
+    Maintenance (*mnt) calls are writes, and one that timed out waiting for its response, or came back with
+    an HTTP 5xx, may have been applied by the app server all the same: sent again, a pdrecno-less price
+    record would be added twice and an added product would come back with an error. So writes are only
+    retried when they never reached the app server: the connection could not be made, or it answered 429.
+"""
+import random
+import threading
+import time
+
+
+def is_write(function):
+    """
+    True for the SXAPI maintenance functions, whose calls may not be sent twice.
+    """
+    return function.lower().endswith('mnt')
+
+
+class TransientError(Exception):
+    """
+    An SXAPI call failed in a way that may go away on its own: an HTTP 5xx or 429, or a response that is not JSON.
+    """
+
+    def __init__(self, function, status, text='', message=None):
+        self.function = function
+        self.status = status
+        self.text = text
+        super().__init__(message or '%s returned HTTP %s: %s' % (function, status, text[:200]))
+
+
+class CircuitOpenError(TransientError):
+    """
+    Raised instead of making a call while the circuit breaker is open.
+    """
+
+    def __init__(self, function, retry_in):
+        self.retry_in = retry_in
+        message = '%s not called, SXAPI is failing. Circuit breaker retries in %.1fs' % (function, retry_in)
+        super().__init__(function, None, message=message)
+
+
+class RetryPolicy:
+    _attempts = 3
+    _base_delay = 0.5
+    _max_delay = 30.0
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=30.0, seed=None):
+        """
+        Input:
+            -attempts, the number of tries a call gets in total. 1 turns retrying off
+            -base_delay, the longest wait before the first retry, in seconds
+            -max_delay, the longest wait before any retry, in seconds
+        """
+        self._attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, section):
+        return cls(attempts=section.getint('retry_attempts', 3),
+                   base_delay=section.getfloat('retry_base_delay', 0.5),
+                   max_delay=section.getfloat('retry_max_delay', 30.0))
+
+    def delay(self, attempt):
+        """
+        Input:
+            -attempt, the number of the attempt that just failed, from 0
+        Output: The seconds to wait before trying again, or None if the call is out of attempts
+        """
+        if attempt + 1 >= self._attempts:
+            return None
+        return self._random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    _threshold = 20
+    _reset_timeout = 30.0
+
+    def __init__(self, threshold=20, reset_timeout=30.0):
+        """
+        Input:
+            -threshold, the number of failed attempts in a row that open the breaker. 0 turns it off. It leaves room
+            for a batch split down to a single bad set, one failure per split
+            -reset_timeout, seconds the breaker stays open before a probe call is let through
+        """
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @classmethod
+    def from_config(cls, section):
+        return cls(threshold=section.getint('breaker_threshold', 20),
+                   reset_timeout=section.getfloat('breaker_reset_timeout', 30.0))
+
+    @property
+    def state(self):
+        """
+        'closed', 'open' or 'half-open'
+        """
+        with self._lock:
+            if self._opened is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened >= self._reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before(self, function):
+        """
+        Called before each call. Raises CircuitOpenError while the breaker is open, or a probe is already out.
+        """
+        with self._lock:
+            if self._opened is None:
+                return
+            waited = time.monotonic() - self._opened
+            if waited < self._reset_timeout or self._probing:
+                raise CircuitOpenError(function, max(0.0, self._reset_timeout - waited))
+            self._probing = True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._threshold and self._failures >= self._threshold and self._opened is None):
+                if self._opened is None:
+                    self.trips += 1
+                self._opened = time.monotonic()
+                self._probing = False
@@ -0,0 +1,116 @@
+"""
+    Multi-process sharded maintenance imports.
+
+    Rows are spread over shards by a stable hash of their key1 column (prod, custno or pdrecno), so
+    every row for a record lands on the same shard and is applied in file order. Each shard runs in its
+    own process with its own client, HTTP pool and batchers, and keeps the set numbers its rows had in
+    the original file. The shards' messages are merged by the set number they start with ('Set 12: ...'),
+    so the ErrorMessage/ReturnData read as if the file had been sent whole.
+"""
+import re
+import zlib
+from operator import itemgetter
+
+SHARD_KEYS = {'sxapiicproductmnt': 'prod', 'sxapiarcustomermnt': 'custno', 'sxapipdpricingmnt': 'pdrecno'}
+
+_SET_NUMBER = re.compile(r'\s*set\s*#?:?\s*(\d+)', re.IGNORECASE)
+
+
+def shard_of(key, shards):
+    """
+    Output: The shard, from 0 to shards - 1, of key. Stable across processes, unlike hash()
+    """
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+def shard_rows(function, rows, shards, skip=()):
+    """
+    Input:
+        -function, the SXAPI maintenance function the rows are imported with
+        -rows, the input rows, in file order
+        -shards, the number of shards
+        -skip, set numbers to leave out, e.g. the sets a journal shows as already applied
+    Output: A list of shards lists of (set_no, row) tuples, in file order. Rows without a key (pricing
+    records to be added) are spread by set number
+    """
+    column = SHARD_KEYS[function]
+    split = [[] for _ in range(shards)]
+    for set_no, row in enumerate(rows, 1):
+        if set_no in skip:
+            continue
+        key = row.get(column, '')
+        if key == '':
+            split[set_no % shards].append((set_no, row))
+        else:
+            split[shard_of(key, shards)].append((set_no, row))
+    return split
+
+
+def message_set(message, default):
+    """
+    Output: The set number a maintenance message starts with, e.g. 12 for 'Set 12: ...', or default
+    """
+    match = _SET_NUMBER.match(message)
+    return int(match.group(1)) if match else default
+
+
+def merge_results(results):
+    """
+    Input:
+        -results, the (first set number, errors, return_data) tuples of the batches of every shard
+    Output: One (errors, return_data) tuple with the messages of all batches in set order. A message that does
+    not start with its set number is put at the first set of its batch. Either list is None if no batch had one
+    """
+    merged = [None, None]
+    for first_set, *lists in results:
+        for i, messages in enumerate(lists):
+            if messages is not None:
+                if merged[i] is None:
+                    merged[i] = []
+                merged[i].extend((message_set(message, first_set), message) for message in messages)
+    # sorted is stable, so the messages of one set keep the order the app server gave them in
+    return tuple(None if keyed is None else [message for _, message in sorted(keyed, key=itemgetter(0))]
+                 for keyed in merged)
+
+
+def import_shard(settings, function, numbered_rows, credentials, workers=None, inflight=None, journal_path=None,
+                 run=None, snapshot_path=None, delta=False, known_keys=None, limiter=None):
+    """
+    Runs one shard of an import. Called in a worker process.
+    Input:
+        -settings, the (mode, endpoint, logfile, debug) of the parent client
+        -journal_path, run, the parent's journal file and import fingerprint, if it has one
+        -snapshot_path, delta, the parent's snapshot file and whether this is a delta import
+        -known_keys, the (prod, whse) keys of these rows the parent's product mirror knows exist, if it has one
+        -limiter, the AdaptiveLimiter.share arguments of this shard's part of the parent's concurrency limit
+    Output: A tuple of (list of (first set number, errors, return_data) tuples, one per batch, and the shard
+    client's Metrics)
+    """
+    from .journal import ImportJournal
+    from .limiter import AdaptiveLimiter
+    from .mirror import ProductMirror
+    from .py_sxapi import py_sxapi
+    from .snapshot import SnapshotStore
+
+    mode, endpoint, logfile, debug = settings
+    journal = ImportJournal(journal_path) if journal_path else None
+    snapshot = SnapshotStore(snapshot_path) if snapshot_path else None
+    mirror = None
+    if known_keys is not None:
+        mirror = ProductMirror(None, prefixes=())
+        for prod, whse in known_keys:
+            mirror.add(prod, whse)
+    if limiter is not None:
+        limiter = AdaptiveLimiter(**limiter)
+    client = py_sxapi(mode, endpoint, logfile=logfile, debug=debug, journal=journal, snapshot=snapshot,
+                      mirror=mirror, limiter=limiter)
+    try:
+        changes = client._numbered_changes(function, numbered_rows, credentials, workers)
+        results = list(client._submit_batches(function, changes, credentials, inflight=inflight, run=run,
+                                              delta=delta, numbered=True))
+        return results, client.metrics
+    finally:
+        client.close()
+        for store in (journal, snapshot):
+            if store is not None:
+                store.close()
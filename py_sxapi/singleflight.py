@@ -0,0 +1,106 @@
+"""
+    Single-flight coalescing of identical SXAPI lookups.
+
+    While a call for a key is in flight, further calls for the same key wait for it and share its
+    result, or its exception, instead of sending their own request. Once it returns, the next call
+    for the key goes out again; keeping results for longer is up to a cache in front of it.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ['done', 'result', 'error']
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Single-flight for threads.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """
+        Input:
+            -key, identifies the call, e.g. (cono, product, use_xref)
+            -fn, a callable making the call
+        Output: The result of fn, run by this thread or by the one already calling it for key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        Output: A dictionary of the calls made and the calls that shared one already in flight
+        """
+        return {'calls': self.calls, 'shared': self.shared}
+
+
+class AsyncSingleFlight:
+    """
+    Single-flight for asyncio tasks of one event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """
+        Input:
+            -key, identifies the call
+            -fn, a callable returning the awaitable making the call
+        Output: The result of fn, awaited by this task or by the one already calling it for key
+        """
+        import asyncio
+
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield, so one waiter being cancelled does not cancel the call for the others
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared}
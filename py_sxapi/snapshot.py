@@ -0,0 +1,140 @@
+"""
+    Snapshot store for delta imports.
+
+    Keeps the last field values applied to each record, keyed by maintenance function, key1 and key2, in
+    a sqlite file (or in memory). In delta mode, 'chg' change records whose value matches the snapshot are
+    dropped before batching, the remaining fields of each set are renumbered, and sets left with nothing
+    to change are not sent at all. The snapshot is updated from every batch that comes back without a
+    cErrorMessage. 'add' records are always sent in full.
+"""
+import json
+import threading
+from itertools import groupby, islice
+from operator import itemgetter
+
+
+class SnapshotStore:
+    _chunk = 500
+
+    def __init__(self, path=None):
+        """
+        Input:
+            -path, the sqlite file the snapshot is kept in. Without one it is only kept in memory
+        """
+        import sqlite3
+
+        self.path = path
+        self._db = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self._lock = threading.Lock()
+        if path:
+            # shard processes write the same file, and every applied batch is committed
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS snapshot (function TEXT, key1 TEXT, key2 TEXT, fields TEXT, '
+                         'PRIMARY KEY (function, key1, key2))')
+        self._db.commit()
+        self.fields_seen = 0
+        self.fields_sent = 0
+
+    def get_many(self, function, keys):
+        """
+        Input:
+            -function, the SXAPI maintenance function
+            -keys, an iterable of (key1, key2) tuples
+        Output: A dictionary mapping each (key1, key2) with a snapshot, as strings, to its {fieldName: fieldValue}
+        """
+        keys = list({(str(key1), str(key2)) for key1, key2 in keys})
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self._chunk):
+                chunk = keys[start:start + self._chunk]
+                where = ' OR '.join(['(key1 = ? AND key2 = ?)'] * len(chunk))
+                params = [function] + [value for key in chunk for value in key]
+                for key1, key2, fields in self._db.execute('SELECT key1, key2, fields FROM snapshot WHERE function = ? '
+                                                           'AND (%s)' % where, params):
+                    found[(key1, key2)] = json.loads(fields)
+        return found
+
+    def update(self, function, changes):
+        """
+        Merges the field values of applied change records into the snapshot.
+        """
+        values = {}
+        for change in changes:
+            key = (str(change['key1']), str(change['key2']))
+            values.setdefault(key, {})[change['fieldName']] = change['fieldValue']
+        self._merge(function, values)
+
+    def put(self, function, key1, key2, fields):
+        """
+        Merges known field values of one record into the snapshot, e.g. values read back from SX.e.
+        Input:
+            -fields, a dictionary of fieldName (lowercase, as in the change records) to fieldValue
+        """
+        self._merge(function, {(str(key1), str(key2)): dict(fields)})
+
+    def _merge(self, function, values):
+        current = self.get_many(function, values)
+        for key, fields in values.items():
+            merged = current.get(key, {})
+            merged.update(fields)
+            values[key] = merged
+
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?)',
+                                 [(function, key1, key2, json.dumps(fields, default=str))
+                                  for (key1, key2), fields in values.items()])
+            self._db.commit()
+
+    def changed(self, function, changes):
+        """
+        Drops the 'chg' change records whose value is already in the snapshot. Values are compared as strings,
+        so 1.5 and '1.5' match.
+        Input:
+            -function, the SXAPI maintenance function
+            -changes, change records in set order
+        Output: Generator of the change records left, with seqNo renumbered within each set
+        """
+        sets = groupby(changes, key=itemgetter('setNo'))
+        while True:
+            chunk = [list(records) for _, records in islice(sets, self._chunk)]
+            if not chunk:
+                return
+            known = self.get_many(function, [(records[0]['key1'], records[0]['key2']) for records in chunk])
+
+            for records in chunk:
+                self.fields_seen += len(records)
+                fields = None
+                if records[0]['updateMode'] == 'chg':
+                    fields = known.get((str(records[0]['key1']), str(records[0]['key2'])))
+                if fields:
+                    records = [change for change in records
+                               if change['fieldName'] not in fields
+                               or str(fields[change['fieldName']]) != str(change['fieldValue'])]
+                    for seq_no, change in enumerate(records, 1):
+                        change['seqNo'] = seq_no
+                self.fields_sent += len(records)
+                yield from records
+
+    def stats(self):
+        """
+        Output: A dictionary of the change records seen and sent in delta mode, and the share sent
+        """
+        return {'fields_seen': self.fields_seen,
+                'fields_sent': self.fields_sent,
+                'sent_rate': self.fields_sent / self.fields_seen if self.fields_seen else 0.0}
+
+    def clear(self, function=None):
+        with self._lock:
+            if function is None:
+                self._db.execute('DELETE FROM snapshot')
+            else:
+                self._db.execute('DELETE FROM snapshot WHERE function = ?', (function,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
@@ -0,0 +1,202 @@
+"""
+    Timing spans for the phases of imports and pricing lookups.
+
+    The clients open a span for each phase of item_import, customer_import, pricing_import and get_pricing:
+    read_input (reading the rows and looking the run up in the journal), resolve_update_modes, build_changes,
+    batch, encode, one span per SXAPI call attempt named after the function, and within it limit_wait (the
+    adaptive limiter), slot_wait (AsyncSxapi's max_in_flight), network and decode. Spans nest: calls made on
+    pool threads are parented to the span that handed them out.
+
+    Tracer is the interface, and does nothing, so an untraced client only pays for a method call per span.
+    RecordingTracer keeps the spans in memory and sums them up per path, OpenTelemetryTracer passes them on
+    to OpenTelemetry (pip install opentelemetry-api, plus an SDK and exporter to send them somewhere).
+    Records built lazily, as with columnar input, are timed as part of the batches that consume them.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    The tracer interface. This base class records nothing.
+    """
+    name = 'off'
+
+    def span(self, name, **attributes):
+        """
+        Input:
+            -name, the span name, e.g. 'encode' or an SXAPI function name
+            -attributes, str, bool, int or float values describing the span
+        Output: A context manager timing the span. It enters as an object with set_attribute(key, value)
+        """
+        return _NULL_SPAN
+
+    def wrap(self, fn):
+        """
+        Output: fn, made to run inside the span open now when called on another thread, e.g. by a thread pool
+        """
+        return fn
+
+
+class _PropagatingTracer(Tracer):
+
+    def wrap(self, fn):
+        context = contextvars.copy_context()
+
+        def run(*args, **kwargs):
+            # a context can only be entered once at a time, and the pool may run fn on several threads
+            return context.copy().run(fn, *args, **kwargs)
+
+        return run
+
+
+_current = contextvars.ContextVar('py_sxapi_span', default=None)
+
+
+class RecordedSpan:
+    __slots__ = ['name', 'path', 'attributes', 'start', 'seconds', 'thread', '_token', '_recorder']
+
+    def __init__(self, recorder, name, attributes):
+        self._recorder = recorder
+        self.name = name
+        self.attributes = attributes
+        self.path = ()
+        self.start = None
+        self.seconds = None
+        self.thread = None
+        self._token = None
+
+    def __enter__(self):
+        parent = _current.get()
+        self.path = (parent.path if parent is not None else ()) + (self.name,)
+        self.thread = threading.current_thread().name
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        _current.reset(self._token)
+        self._token = None
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self._recorder._record(self)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class RecordingTracer(_PropagatingTracer):
+    """
+    Keeps the last max_spans finished spans in memory.
+    """
+    name = 'record'
+
+    def __init__(self, max_spans=100000):
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        return RecordedSpan(self, name, attributes)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def summary(self):
+        """
+        Output: A dictionary mapping each span path, a tuple of span names from the root, to a dictionary of its
+        count and its total and longest seconds. Paths are in the order their first span started
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        totals = {}
+        for span in spans:
+            total = totals.get(span.path)
+            if total is None:
+                total = totals[span.path] = {'count': 0, 'seconds': 0.0, 'max': 0.0}
+            total['count'] += 1
+            total['seconds'] += span.seconds
+            total['max'] = max(total['max'], span.seconds)
+        return totals
+
+    def report(self):
+        """
+        Output: The summary as an indented text table. Spans of pool threads overlap, so the seconds of a
+        span's children can add up to more than its own
+        """
+        summary = self.summary()
+        # children right under their parent, in the order they first started
+        order = {path: i for i, path in enumerate(summary)}
+        paths = sorted(summary, key=lambda path: [order.get(path[:i + 1], 0) for i in range(len(path))])
+        width = max([len(path) * 2 + len(path[-1]) for path in paths] + [4])
+        lines = ['%s %8s %10s %10s %10s' % ('span'.ljust(width), 'count', 'total_s', 'mean_ms', 'max_ms')]
+        for path in paths:
+            total = summary[path]
+            lines.append('%s %8d %10.3f %10.2f %10.2f' % (('  ' * (len(path) - 1) + path[-1]).ljust(width),
+                                                          total['count'], total['seconds'],
+                                                          total['seconds'] / total['count'] * 1000,
+                                                          total['max'] * 1000))
+        return '\n'.join(lines)
+
+
+class OpenTelemetryTracer(_PropagatingTracer):
+    """
+    Hands spans to an OpenTelemetry tracer. OpenTelemetry keeps the current span in a contextvar as well, so
+    wrap carries it over to pool threads.
+    """
+    name = 'opentelemetry'
+
+    def __init__(self, tracer=None):
+        """
+        Input:
+            -tracer, an opentelemetry.trace.Tracer. Defaults to the global tracer provider's 'py_sxapi' tracer
+        """
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError('OpenTelemetryTracer requires opentelemetry-api, install it with: '
+                                  'pip install py_sxapi[opentelemetry]')
+            tracer = trace.get_tracer('py_sxapi')
+        self._tracer = tracer
+
+    def span(self, name, **attributes):
+        return self._tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def tracer_from_config(section):
+    """
+    Builds the tracer named by the tracing setting of a config.ini section: off, record or opentelemetry.
+    """
+    name = section.get('tracing', 'off').strip().lower()
+    if name in ('', 'off', 'no'):
+        return Tracer()
+    if name == 'record':
+        return RecordingTracer()
+    if name == 'opentelemetry':
+        return OpenTelemetryTracer()
+    raise ValueError('Unknown tracing setting %r, expected off, record or opentelemetry' % name)
@@ -0,0 +1,125 @@
+"""
+    Pooled HTTP transport shared by the SXAPI clients.
+
+    Each client owns one Transport, which keeps a requests.Session with a
+    bounded connection pool so consecutive SXAPI calls reuse the same
+    keep-alive connections to sxapirestservice. requests is only imported,
+    and the session only built, when the first call goes out.
+"""
+import threading
+
+from .compression import ACCEPT_ENCODING, Compressor
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+class Transport:
+    _endpoint = ''
+    _timeout = (5.0, 60.0)
+    _session = None
+
+    def __init__(self, endpoint, pool_size=10, connect_timeout=5.0, read_timeout=60.0, keep_alive=True,
+                 compressor=None, metrics=None):
+        """
+        Input:
+            -endpoint, the base url of the SXAPI REST service
+            -pool_size, the max number of connections kept open to the endpoint. Calls beyond it wait for a
+            connection to be free rather than opening one that is thrown away afterwards
+            -connect_timeout, seconds to wait for a connection to be established
+            -read_timeout, seconds to wait for the app server to answer
+            -keep_alive, whether connections are reused between calls
+            -compressor, an optional Compressor for request bodies
+            -metrics, an optional Metrics the compression ratios and times are recorded in
+        """
+        self._endpoint = endpoint
+        self._timeout = (connect_timeout, read_timeout)
+        self._compressor = compressor
+        self._metrics = metrics
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        session = self._session
+        if session is not None:
+            return session
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size,
+                                      pool_block=True)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+                if not self._keep_alive:
+                    session.headers['Connection'] = 'close'
+                session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+                self._session = session
+        return self._session
+
+    @classmethod
+    def from_config(cls, endpoint, section, metrics=None, min_pool_size=0):
+        """
+        Builds a Transport from a config.ini section. Missing options fall back to the defaults.
+        Input:
+            -endpoint, the base url of the SXAPI REST service
+            -section, a configparser section, e.g. config['prod']
+            -metrics, an optional Metrics the compression ratios and times are recorded in
+            -min_pool_size, the number of calls the client may have out at once, if more than pool_size
+        Output: A Transport
+        """
+        return cls(endpoint,
+                   pool_size=max(section.getint('pool_size', 10), min_pool_size),
+                   connect_timeout=section.getfloat('connect_timeout', 5.0),
+                   read_timeout=section.getfloat('read_timeout', 60.0),
+                   keep_alive=section.getboolean('keep_alive', True),
+                   compressor=Compressor.from_config(section),
+                   metrics=metrics)
+
+    @property
+    def endpoint(self):
+        return self._endpoint
+
+    def post(self, function, data, timeout=None):
+        """
+        Posts a request payload to an SXAPI function.
+        Input:
+            -function, the SXAPI function name, e.g. sxapiicproductmnt
+            -data, the request payload, either a dictionary or already encoded JSON bytes
+            -timeout, optional (connect, read) tuple or float overriding the transport default
+        Output: The requests.Response
+        """
+        if timeout is None:
+            timeout = self._timeout
+        if not isinstance(data, bytes):
+            return self._get_session().post(self._endpoint + function, json=data, timeout=timeout)
+
+        headers = JSON_HEADERS
+        if self._compressor is not None:
+            body, encoding, seconds = self._compressor.compress(function, data)
+            if encoding is not None:
+                headers = dict(JSON_HEADERS, **{'Content-Encoding': encoding})
+                if self._metrics is not None:
+                    self._metrics.observe_compression(function, 'request', len(data), len(body), seconds)
+                data = body
+
+        response = self._get_session().post(self._endpoint + function, data=data, headers=headers, timeout=timeout)
+
+        if self._metrics is not None and response.headers.get('Content-Encoding') in ('gzip', 'deflate'):
+            # raw.tell() counts the bytes read off the wire, before urllib3 decoded them
+            self._metrics.observe_compression(function, 'response', len(response.content), response.raw.tell())
+        return response
+
+    def get(self, path, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self._timeout
+        return self._get_session().get(self._endpoint + path, timeout=timeout, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
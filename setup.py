@@ -12,6 +12,14 @@ setup(
 	url='https://bitbucket.org/psscorp/py-sxapi',
 	include_package_data=True,
 	install_requires=[
-		'bs4','requests',
+		'requests',
 	],
+	extras_require={
+		'async': ['aiohttp'],
+		'columnar': ['pandas', 'pyarrow'],
+		'opentelemetry': ['opentelemetry-api'],
+	},
+	entry_points={
+		'console_scripts': ['py-sxapi=py_sxapi.cli:main'],
+	},
 )
\ No newline at end of file